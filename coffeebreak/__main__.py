@@ -0,0 +1,31 @@
+"""Command line entry point for CoffeeBreak CLI."""
+
+import os
+import sys
+
+
+def _program_name() -> str:
+    """Return the program name the way Click reports it."""
+    if os.path.basename(sys.argv[0]) == '__main__.py':
+        return 'python -m coffeebreak'
+    return os.path.basename(sys.argv[0])
+
+
+def main() -> None:
+    """
+    Run the CLI.
+    
+    A bare --version is answered before Click and the command tree are
+    imported; everything else goes through the Click group.
+    """
+    if sys.argv[1:] == ['--version']:
+        from coffeebreak import __version__
+        print(f"{_program_name()}, version {__version__}")
+        return
+    
+    from coffeebreak.cli import cli
+    cli()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,12 @@ from .manager import BackupManager
 from .scheduler import BackupScheduler
 from .recovery import RecoveryManager
 from .storage import BackupStorage
+from .cron import CronManager
 
 __all__ = [
     'BackupManager',
     'BackupScheduler', 
     'RecoveryManager',
-    'BackupStorage'
+    'BackupStorage',
+    'CronManager'
 ]
\ No newline at end of file
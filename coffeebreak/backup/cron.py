@@ -0,0 +1,174 @@
+"""Batched crontab editing for backup components."""
+
+import subprocess
+import threading
+from typing import List, Optional, Tuple
+
+from ..utils.errors import ConfigurationError
+
+# Seconds to wait for the crontab command before giving up
+_CRONTAB_TIMEOUT = 10
+
+
+def _without(lines: List[str], removals: List[Tuple[str, Optional[str]]]) -> List[str]:
+    """Drop lines mentioning a removal marker (other than its kept line) and the comment above each."""
+    kept: List[str] = []
+    for line in lines:
+        if any(marker in line and line.strip() != keep for marker, keep in removals):
+            if kept and kept[-1].lstrip().startswith('#'):
+                kept.pop()
+            continue
+        kept.append(line)
+    return kept
+
+
+class CronManager:
+    """
+    Collects crontab changes from several components and installs them at once.
+
+    The crontab is read once up front to answer membership checks; on save it is
+    re-read and the pending removals and additions are applied to it, so lines
+    written by other tools in the meantime are preserved.
+    """
+
+    def __init__(self, verbose: bool = False):
+        """
+        Initialize cron manager.
+
+        Args:
+            verbose: Enable verbose output
+        """
+        self.verbose = verbose
+        self._lines: List[str] = []
+        self._entries = set()
+        self._pending: List[Tuple[Optional[str], str]] = []
+        self._removals: List[Tuple[str, Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "CronManager":
+        self.load()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.save()
+
+    def load(self) -> None:
+        """Read the current crontab and drop any pending changes."""
+        lines = self._read()
+
+        with self._lock:
+            self._lines = lines
+            self._entries = {line.strip() for line in lines}
+            self._pending = []
+            self._removals = []
+
+    def contains(self, marker: str) -> bool:
+        """Check whether any crontab line mentions marker."""
+        with self._lock:
+            return any(marker in line for line in self._lines)
+
+    def add(self, entry: str, comment: Optional[str] = None) -> bool:
+        """
+        Add a cron entry unless it is already present.
+
+        Args:
+            entry: Cron entry line
+            comment: Optional comment written above a newly added entry
+
+        Returns:
+            bool: True if the entry was added
+        """
+        with self._lock:
+            if entry.strip() in self._entries:
+                return False
+
+            self._lines.append(entry)
+            self._entries.add(entry.strip())
+            self._pending.append((comment, entry))
+            return True
+
+    def remove(self, marker: str, keep: Optional[str] = None) -> bool:
+        """
+        Remove every crontab line that mentions marker.
+
+        The comment line directly above a removed line goes with it, matching
+        the layout add() writes.
+
+        Args:
+            marker: Text identifying the lines to remove
+            keep: Exact entry to leave in place even though it mentions marker
+
+        Returns:
+            bool: True if any line was removed
+        """
+        removal = (marker, keep.strip() if keep else None)
+
+        with self._lock:
+            lines = _without(self._lines, [removal])
+            if len(lines) == len(self._lines):
+                return False
+
+            self._lines = lines
+            self._entries = {line.strip() for line in lines}
+            self._removals.append(removal)
+            return True
+
+    def save(self) -> None:
+        """Apply pending removals and additions to the current crontab and install it."""
+        with self._lock:
+            pending = list(self._pending)
+            removals = list(self._removals)
+        if not pending and not removals:
+            return
+
+        lines = _without(self._read(), removals)
+        present = {line.strip() for line in lines}
+        for comment, entry in pending:
+            if entry.strip() in present:
+                continue
+            if comment:
+                lines.append(f"# {comment}")
+            lines.append(entry)
+            present.add(entry.strip())
+        content = "\n".join(lines) + "\n"
+
+        try:
+            # Only crontab's error output is kept, for the failure message
+            result = subprocess.run(['crontab', '-'], input=content, text=True,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                    timeout=_CRONTAB_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ConfigurationError(f"Failed to install crontab: {e}") from e
+        if result.returncode != 0:
+            raise ConfigurationError(f"Failed to install crontab: {result.stderr.strip()}")
+
+        with self._lock:
+            self._lines = lines
+            self._entries = present
+            self._pending = []
+            self._removals = []
+
+        if self.verbose:
+            print("Crontab updated")
+
+    def _read(self) -> List[str]:
+        """
+        Return the current crontab lines.
+
+        Only a missing crontab counts as empty; any other failure raises, since
+        save() would otherwise replace the user's crontab with just our entries.
+
+        Raises:
+            ConfigurationError: If the crontab could not be listed
+        """
+        try:
+            result = subprocess.run(['crontab', '-l'], capture_output=True, text=True,
+                                    timeout=_CRONTAB_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ConfigurationError(f"Failed to read crontab: {e}") from e
+        if result.returncode == 0:
+            return result.stdout.splitlines()
+        if 'no crontab for' in result.stderr:
+            return []
+        raise ConfigurationError(f"Failed to read crontab: {result.stderr.strip()}")
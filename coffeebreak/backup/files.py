@@ -0,0 +1,249 @@
+"""Helpers for installing generated backup and recovery files."""
+
+import os
+import re
+import secrets
+import stat
+import tempfile
+from functools import lru_cache
+from itertools import zip_longest
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Upper bound on buffers per writev call (POSIX guarantees at least 16; Linux allows 1024)
+_IOV_MAX = 1024
+
+_DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# @TOKEN@ placeholders in the packaged shell script templates
+_TOKEN_PATTERN = re.compile(r'@([A-Z][A-Z0-9_]*)@')
+
+
+def _write_fd(fd: int, chunks: Sequence[bytes], mode: int) -> None:
+    """Write chunks to fd in order and set its permissions.
+    
+    With os.writev the chunks go out in as few system calls as possible
+    without ever being concatenated.
+    """
+    views = [memoryview(chunk) for chunk in chunks if chunk]
+    index = 0
+    while index < len(views):
+        if hasattr(os, 'writev'):
+            written = os.writev(fd, views[index:index + _IOV_MAX])
+        else:
+            written = os.write(fd, views[index])
+        # Skip the buffers written in full and trim a partially written one
+        while index < len(views) and written >= len(views[index]):
+            written -= len(views[index])
+            index += 1
+        if written:
+            views[index] = views[index][written:]
+    os.fchmod(fd, mode)
+
+
+def _chunks(data: Union[bytes, Sequence[bytes]]) -> Sequence[bytes]:
+    """Accept either a single bytes object or a sequence of byte chunks."""
+    return [data] if isinstance(data, bytes) else data
+
+
+def _link_tmpfile(directory: str, data: Sequence[bytes], mode: int) -> Optional[str]:
+    """Write data to an anonymous O_TMPFILE inode and link it under a temporary name.
+    
+    Returns:
+        Optional[str]: Temporary path, or None if O_TMPFILE is not usable here
+    """
+    if not hasattr(os, 'O_TMPFILE'):
+        return None
+    
+    try:
+        fd = os.open(directory, os.O_TMPFILE | os.O_WRONLY | os.O_CLOEXEC, mode)
+    except OSError:
+        # Filesystem without O_TMPFILE support
+        return None
+    
+    dir_fd = None
+    try:
+        _write_fd(fd, data, mode)
+        tmp_name = f'.tmp-{secrets.token_hex(8)}'
+        # A destination dir_fd makes os.link use linkat(AT_SYMLINK_FOLLOW),
+        # which links the inode behind the /proc fd symlink
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+        try:
+            os.link(f'/proc/self/fd/{fd}', tmp_name, dst_dir_fd=dir_fd, follow_symlinks=True)
+        except OSError:
+            # /proc is not mounted; the anonymous inode is discarded on close
+            return None
+    finally:
+        os.close(fd)
+        if dir_fd is not None:
+            os.close(dir_fd)
+    
+    return os.path.join(directory, tmp_name)
+
+
+def _mkstemp_file(directory: str, data: Sequence[bytes], mode: int) -> str:
+    """Write data to a named temporary file in directory and return its path."""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        _write_fd(fd, data, mode)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    os.close(fd)
+    return tmp_path
+
+
+def atomic_write(path: str, data: Union[bytes, Sequence[bytes]], mode: int = 0o644) -> None:
+    """Atomically replace path with data, created with the given permissions.
+    
+    On Linux the data is written to an unnamed O_TMPFILE inode that only gets
+    a directory entry once it is complete, so a crash mid-write leaves neither
+    a truncated file nor a stray temporary one. Elsewhere a named temporary
+    file is used. Either way the result is renamed over path.
+    
+    Args:
+        path: Destination path
+        data: File content, as bytes or a sequence of byte chunks
+        mode: Permission bits for the new file
+    """
+    atomic_write_all({path: data}, mode)
+
+
+def atomic_write_all(files: Dict[str, Union[bytes, Sequence[bytes]]], mode: int = 0o644) -> None:
+    """Atomically replace several files, writing all of them before replacing any.
+    
+    Every content is first written to a temporary file next to its
+    destination; the temporary files are renamed over the destinations only
+    once all writes succeeded, so a failed write leaves every destination as
+    it was.
+    
+    Args:
+        files: File content, as bytes or a sequence of byte chunks, by destination path
+        mode: Permission bits for the new files
+    """
+    staged: List[Tuple[str, str]] = []
+    try:
+        for path, data in files.items():
+            directory = os.path.dirname(path) or '.'
+            data = _chunks(data)
+            tmp_path = _link_tmpfile(directory, data, mode) or _mkstemp_file(directory, data, mode)
+            staged.append((tmp_path, path))
+        
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+    except BaseException:
+        for tmp_path, _ in staged:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        raise
+
+
+def write_if_changed(path: str, data: Union[bytes, Sequence[bytes]], mode: int = 0o644) -> bool:
+    """Atomically write data to path unless the file already has that content and mode.
+    
+    Args:
+        path: Destination path
+        data: File content, as bytes or a sequence of byte chunks
+        mode: Permission bits for the file
+    
+    Returns:
+        bool: True if the file was written
+    """
+    data = _chunks(data)
+    try:
+        with open(path, 'rb') as f:
+            if (stat.S_IMODE(os.fstat(f.fileno()).st_mode) == mode
+                    and f.read() == b''.join(data)):
+                return False
+    except OSError:
+        pass
+    
+    atomic_write(path, data, mode)
+    return True
+
+
+def _script_body(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the lines of chunked content, minus the '# Generated:' header line.
+    
+    Only the current line is buffered, so content can be compared without
+    joining it into one bytes object.
+    """
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from (line for line in lines if not line.startswith(b'# Generated:'))
+    if not pending.startswith(b'# Generated:'):
+        yield pending
+
+
+def write_exec_script(path: str, content: Union[str, Sequence[bytes]]) -> bool:
+    """Atomically install an executable script at path.
+    
+    An existing executable script with the same content is left untouched
+    so its mtime survives idempotent re-runs.
+    
+    Args:
+        path: Destination path
+        content: Script text, or the script as a sequence of byte chunks
+    
+    Returns:
+        bool: True if the script was written
+    """
+    data: List[bytes] = [content.encode()] if isinstance(content, str) else list(content)
+    try:
+        with open(path, 'rb') as f:
+            existing = _script_body(iter(lambda: f.read(65536), b''))
+            unchanged = all(old == new for old, new in
+                            zip_longest(existing, _script_body(data)))
+        if unchanged and os.access(path, os.X_OK):
+            return False
+    except OSError:
+        pass
+    
+    atomic_write(path, data, 0o755)
+    return True
+
+
+def encryption_key_path(deployment_type: str, config: Dict[str, Any]) -> str:
+    """Return the absolute path of the key file backups are encrypted with."""
+    if deployment_type == 'standalone':
+        default_key_file = "/etc/coffeebreak/backup.key"
+    else:
+        default_key_file = "./secrets/backup.key"
+    
+    return os.path.abspath(config.get('encryption_key_file', default_key_file))
+
+
+def dedup_repo_path(config: Dict[str, Any]) -> str:
+    """Return the absolute path of the restic repository, or '' when archives are written."""
+    dedup_repo = config.get('dedup_repo') or ''
+    return os.path.abspath(dedup_repo) if dedup_repo else ''
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> str:
+    """Read a packaged template; templates are read once per process."""
+    with open(os.path.join(_DATA_DIR, name), 'r') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def _script_parts(name: str) -> Tuple[Union[bytes, str], ...]:
+    """Split a script template into pre-encoded text chunks and the token names between them."""
+    parts = _TOKEN_PATTERN.split(load_template(name))
+    return tuple(part.encode() if index % 2 == 0 else part for index, part in enumerate(parts))
+
+
+def render_script(name: str, values: Dict[str, Any]) -> List[bytes]:
+    """Render a packaged script template as byte chunks, substituting each @TOKEN@ from values.
+    
+    Args:
+        name: Template file name under the package data directory
+        values: Replacement for every token, keyed by token name
+    
+    Returns:
+        List[bytes]: Script content, ready for write_exec_script
+    """
+    return [part if index % 2 == 0 else str(values[part]).encode()
+            for index, part in enumerate(_script_parts(name))]
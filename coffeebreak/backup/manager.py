@@ -1,188 +1,97 @@
 """Backup management system for production deployments."""
 
+import io
 import os
-import subprocess
+import secrets
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from string import Template
+from typing import Dict, Any, List, Optional, Tuple
 import yaml
 import json
 
 from ..utils.errors import ConfigurationError
+from .cron import CronManager
+from .files import dedup_repo_path, encryption_key_path, write_exec_script
 from .scheduler import BackupScheduler
 from .recovery import RecoveryManager
 from .storage import BackupStorage
 
+# Compression programs for backup archives: (tar compress program, archive extension)
+_COMPRESSORS = {
+    'zstd': ('zstd -T0 --rsyncable -q', 'tar.zst'),
+    'pigz': ('pigz -p$MAX_PARALLEL_JOBS --rsyncable', 'tar.gz'),
+    'gzip': ('gzip --rsyncable', 'tar.gz'),
+}
 
-class BackupManager:
-    """Manages backup operations for production deployments."""
-    
-    def __init__(self, 
-                 deployment_type: str = "docker",
-                 verbose: bool = False):
-        """
-        Initialize backup manager.
-        
-        Args:
-            deployment_type: Type of deployment (docker, standalone)
-            verbose: Enable verbose output
-        """
-        self.deployment_type = deployment_type
-        self.verbose = verbose
-        
-        # Initialize components
-        self.scheduler = BackupScheduler(deployment_type=deployment_type, verbose=verbose)
-        self.recovery = RecoveryManager(deployment_type=deployment_type, verbose=verbose)
-        self.storage = BackupStorage(deployment_type=deployment_type, verbose=verbose)
-    
-    def setup_backup_system(self, 
-                           domain: str,
-                           backup_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """
-        Set up comprehensive backup system.
-        
-        Args:
-            domain: Production domain
-            backup_config: Optional backup configuration
-            
-        Returns:
-            Dict[str, Any]: Setup results
-        """
-        try:
-            if self.verbose:
-                print(f"Setting up backup system for {domain}")
-            
-            setup_result = {
-                'success': True,
-                'domain': domain,
-                'deployment_type': self.deployment_type,
-                'components_setup': [],
-                'errors': [],
-                'backup_location': None,
-                'recovery_scripts': []
-            }
-            
-            # Default backup configuration
-            config = {
-                'domain': domain,
-                'retention_days': 30,
-                'backup_schedule': '0 2 * * *',  # Daily at 2 AM
-                'full_backup_schedule': '0 3 * * 0',  # Weekly on Sunday at 3 AM
-                'enable_encryption': True,
-                'enable_compression': True,
-                'backup_databases': True,
-                'backup_files': True,
-                'backup_configs': True,
-                'remote_storage': False,
-                'verify_backups': True
-            }
-            
-            if backup_config:
-                config.update(backup_config)
-            
-            # 1. Setup backup storage
-            storage_setup = self.storage.setup_backup_storage(config)
-            if storage_setup['success']:
-                setup_result['components_setup'].append('backup_storage')
-                setup_result['backup_location'] = storage_setup.get('backup_path')
-            else:
-                setup_result['errors'].extend(storage_setup['errors'])
-            
-            # 2. Create backup scripts
-            scripts_setup = self._create_backup_scripts(domain, config)
-            if scripts_setup['success']:
-                setup_result['components_setup'].append('backup_scripts')
-                setup_result['recovery_scripts'] = scripts_setup.get('scripts', [])
-            else:
-                setup_result['errors'].extend(scripts_setup['errors'])
-            
-            # 3. Setup backup scheduling
-            schedule_setup = self.scheduler.setup_backup_schedule(domain, config)
-            if schedule_setup['success']:
-                setup_result['components_setup'].append('backup_scheduling')
-            else:
-                setup_result['errors'].extend(schedule_setup['errors'])
-            
-            # 4. Setup recovery procedures
-            recovery_setup = self.recovery.setup_recovery_procedures(domain, config)
-            if recovery_setup['success']:
-                setup_result['components_setup'].append('recovery_procedures')
-            else:
-                setup_result['errors'].extend(recovery_setup['errors'])
-            
-            # 5. Create backup verification system
-            verification_setup = self._setup_backup_verification(domain, config)
-            if verification_setup['success']:
-                setup_result['components_setup'].append('backup_verification')
-            else:
-                setup_result['errors'].extend(verification_setup['errors'])
-            
-            # 6. Setup monitoring and alerting
-            monitoring_setup = self._setup_backup_monitoring(domain, config)
-            if monitoring_setup['success']:
-                setup_result['components_setup'].append('backup_monitoring')
-            else:
-                setup_result['errors'].extend(monitoring_setup['errors'])
-            
-            setup_result['success'] = len(setup_result['errors']) == 0
-            
-            if self.verbose:
-                if setup_result['success']:
-                    print(f"Backup system setup completed successfully for {domain}")
-                    print(f"Components: {', '.join(setup_result['components_setup'])}")
-                else:
-                    print(f"Backup system setup completed with {len(setup_result['errors'])} errors")
-            
-            return setup_result
-            
-        except Exception as e:
-            raise ConfigurationError(f"Failed to setup backup system: {e}")
-    
-    def _create_backup_scripts(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Create backup scripts."""
-        setup_result = {
-            'success': True,
-            'errors': [],
-            'scripts': []
-        }
-        
-        try:
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-                backup_dir = f"/opt/coffeebreak/backups"
-            else:
-                scripts_dir = "./scripts"
-                backup_dir = "./backups"
-            
-            os.makedirs(scripts_dir, exist_ok=True)
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            # Main backup script
-            backup_script = f"""#!/bin/bash
+
+class _ScriptTemplate(Template):
+    """Template for generated shell scripts; ``@@`` leaves bash ``$`` expansions alone."""
+    delimiter = '@@'
+
+
+_BACKUP_SH_HEAD = _ScriptTemplate("""#!/bin/bash
 # CoffeeBreak Backup Script
-# Domain: {domain}
-# Generated: {datetime.now().isoformat()}
+# Domain: @@{DOMAIN}
+# Generated: @@{GENERATED}
 
 set -euo pipefail
 
-DOMAIN="{domain}"
-BACKUP_DIR="{backup_dir}"
+DOMAIN="@@{DOMAIN}"
+BACKUP_DIR="@@{BACKUP_DIR}"
 LOG_FILE="/var/log/coffeebreak/backup.log"
-RETENTION_DAYS={config.get('retention_days', 30)}
-ENABLE_ENCRYPTION={str(config.get('enable_encryption', True)).lower()}
-ENABLE_COMPRESSION={str(config.get('enable_compression', True)).lower()}
+ENCRYPTION_KEY_FILE="@@{ENCRYPTION_KEY_FILE}"
+RETENTION_DAYS=@@{RETENTION_DAYS}
+ENABLE_ENCRYPTION=@@{ENABLE_ENCRYPTION}
+ENABLE_COMPRESSION=@@{ENABLE_COMPRESSION}
+FILE_BACKUP_MODE="@@{FILE_BACKUP_MODE}"
+MAX_PARALLEL_JOBS=$(nproc 2>/dev/null || echo 1)
+MAX_PARALLEL_DBS=@@{MAX_PARALLEL_DBS}
+PG_DUMP_JOBS=@@{PG_DUMP_JOBS}
+COMPRESS_PROGRAM="@@{COMPRESS_PROGRAM}"
+ARCHIVE_EXT="@@{ARCHIVE_EXT}"
+DEDUP_REPO="@@{DEDUP_REPO}"
+
+# Fall back to plain gzip when the configured compressor is not installed
+if ! command -v "${COMPRESS_PROGRAM%% *}" &> /dev/null; then
+    COMPRESS_PROGRAM="gzip"
+    ARCHIVE_EXT="tar.gz"
+fi
+
+# Deduplicating repository (restic); fall back to archives when restic is missing
+if [ -n "$DEDUP_REPO" ] && ! command -v restic &> /dev/null; then
+    echo "WARNING: restic not installed, writing archives instead of using $DEDUP_REPO" >&2
+    DEDUP_REPO=""
+fi
+export RESTIC_REPOSITORY="$DEDUP_REPO"
+export RESTIC_PASSWORD_FILE="$ENCRYPTION_KEY_FILE"
+
+# Prefer AES-NI accelerated openssl for encryption, fall back to GPG
+if command -v openssl &> /dev/null; then
+    ENCRYPTION_TOOL="openssl"
+    ENCRYPTION_EXT="enc"
+elif command -v gpg &> /dev/null; then
+    ENCRYPTION_TOOL="gpg"
+    ENCRYPTION_EXT="gpg"
+else
+    ENCRYPTION_TOOL=""
+    ENCRYPTION_EXT=""
+fi
 
 # Create log directory
 mkdir -p "$(dirname "$LOG_FILE")"
 
-# Function to log with timestamp
-log_message() {{
+""")
+
+_BACKUP_SH_HELPERS = _ScriptTemplate("""# Function to log with timestamp
+log_message() {
     echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
+}
 
 # Function to handle errors
-handle_error() {{
+handle_error() {
     local error_msg="$1"
     log_message "ERROR: $error_msg"
     
@@ -192,100 +101,228 @@ handle_error() {{
     fi
     
     exit 1
-}}
+}
+
+# Function to block until a background job slot is free
+wait_for_slot() {
+    while [ "$(jobs -rp | wc -l)" -ge "$MAX_PARALLEL_JOBS" ]; do
+        wait -n || return 1
+    done
+}
+
+# Function to wait for background jobs, failing if any of them failed
+wait_for_jobs() {
+    local failed=0
+    local pid
+    for pid in "$@"; do
+        wait "$pid" || failed=1
+    done
+    return $failed
+}
+
+# Function to encrypt stdin into the given file using the backup key file
+encrypt_stream() {
+    local output="$1"
+    
+    if [ "$ENCRYPTION_TOOL" = "openssl" ]; then
+        openssl enc -aes-256-ctr -pbkdf2 -iter 200000 -salt -pass "file:$ENCRYPTION_KEY_FILE" -out "$output"
+    else
+        # Since GnuPG 2.1 --passphrase-file needs loopback pinentry to be honoured
+        gpg --batch --yes --pinentry-mode loopback --symmetric --cipher-algo AES256 --compress-algo 0 --passphrase-file "$ENCRYPTION_KEY_FILE" --output "$output"
+    fi
+}
 
 # Function to create timestamped backup directory
-create_backup_dir() {{
+create_backup_dir() {
     local timestamp=$(date +%Y%m%d_%H%M%S)
     local backup_type="$1"
     local backup_path="$BACKUP_DIR/$backup_type/$timestamp"
     
     mkdir -p "$backup_path"
     echo "$backup_path"
-}}
+}
 
-# Function to compress and encrypt backup
-finalize_backup() {{
-    local backup_path="$1"
-    local backup_name="$(basename "$backup_path")"
-    local parent_dir="$(dirname "$backup_path")"
+# Function to record a finished backup in today's manifest for its category;
+# manifests live in their own directory so they are never taken for backups
+# Usage: record_manifest <path> [size] [sha256]
+record_manifest() {
+    local path="$1"
+    local size="${2:-$(stat -c %s "$path")}"
+    local digest="${3:-$(sha256sum "$path" | cut -d' ' -f1)}"
+    local category="${path#"$BACKUP_DIR"/}"
+    
+    printf '%s\\t%s\\t%s\\n' "$path" "$size" "$digest" >> "$BACKUP_DIR/manifests/${category%%/*}-$(date +%Y%m%d).tsv"
+}
+
+# Function to store the output of a producer command in the deduplicating repository
+# Usage: store_in_repo <output path without extension> <command> [args...]
+store_in_repo() {
+    local output="$1"
+    shift
+    local name="$(basename "$(dirname "$output")")-$(basename "$output")"
+    
+    if ! restic cat config > /dev/null 2>&1; then
+        mkdir -p "$DEDUP_REPO"
+        restic init --quiet || return 1
+    fi
     
-    cd "$parent_dir"
+    # The stream stays uncompressed so restic's content-defined chunking can
+    # find the data shared with earlier backups; restic compresses and encrypts
+    "$@" | restic backup --quiet --stdin --stdin-filename "$name.${BACKUP_FORMAT:-tar}" --tag "$name" || return 1
+    
+    record_manifest "$output" restic "$name" || return 1
+    log_message "Backup stored in repository $DEDUP_REPO: $name"
+}
+
+# Function to compress and encrypt the output of a producer command into the final archive
+# Usage: [BACKUP_FORMAT=<ext>] finalize_backup <output path without extension> <command> [args...]
+# BACKUP_FORMAT names the producer's stream format and defaults to tar
+finalize_backup() {
+    local output="$1"
+    shift
+    local format="${BACKUP_FORMAT:-tar}"
+    local compress="cat"
+    
+    if [ -n "$DEDUP_REPO" ]; then
+        store_in_repo "$output" "$@"
+        return
+    fi
     
     if [ "$ENABLE_COMPRESSION" = "true" ]; then
-        log_message "Compressing backup: $backup_name"
-        tar -czf "${{backup_name}}.tar.gz" "$backup_name"
-        rm -rf "$backup_name"
-        backup_name="${{backup_name}}.tar.gz"
-    fi
-    
-    if [ "$ENABLE_ENCRYPTION" = "true" ]; then
-        log_message "Encrypting backup: $backup_name"
-        if command -v gpg &> /dev/null; then
-            gpg --symmetric --cipher-algo AES256 --compress-algo 1 --output "${{backup_name}}.gpg" "$backup_name"
-            rm -f "$backup_name"
-            backup_name="${{backup_name}}.gpg"
-        else
-            log_message "WARNING: GPG not available, skipping encryption"
+        compress="$COMPRESS_PROGRAM"
+        output="${output}.${format}.${ARCHIVE_EXT#tar.}"
+    else
+        output="${output}.${format}"
+    fi
+    
+    if [ "$ENABLE_ENCRYPTION" = "true" ] && [ -n "$ENCRYPTION_TOOL" ]; then
+        output="${output}.${ENCRYPTION_EXT}"
+        "$@" | $compress | encrypt_stream "$output" || return 1
+    else
+        if [ "$ENABLE_ENCRYPTION" = "true" ]; then
+            log_message "WARNING: Neither openssl nor GPG available, skipping encryption"
         fi
+        "$@" | $compress > "$output" || return 1
     fi
     
-    log_message "Backup finalized: $parent_dir/$backup_name"
-}}
+    record_manifest "$output" || return 1
+    log_message "Backup finalized: $output"
+}
+
+""")
+
+_BACKUP_SH_PG_FUNC = _ScriptTemplate("""# Function to dump one PostgreSQL database in directory format
+dump_postgresql_database() {
+    local db="$1"
+    local backup_path="$2"
+    local dump_dir="$backup_path/${db}.dir"
+    
+    log_message "Backing up PostgreSQL database: $db"
+    
+    # Directory-format dump lets pg_dump extract tables in parallel;
+    # compression is left to the single streaming pass in finalize_backup
+    install -d -o postgres -m 700 "$dump_dir" || return 1
+    sudo -u postgres pg_dump -Fd -j "$PG_DUMP_JOBS" -Z 0 -f "$dump_dir" "$db"
+}
 
 # Function to backup PostgreSQL databases
-backup_postgresql() {{
+backup_postgresql() {
     log_message "Starting PostgreSQL backup"
     
     local backup_path=$(create_backup_dir "postgresql")
     
-    # Get list of databases
-    local databases
-    if systemctl is-active --quiet postgresql; then
-        databases=$(sudo -u postgres psql -t -c "SELECT datname FROM pg_database WHERE NOT datistemplate AND datname != 'postgres';" 2>/dev/null || echo "")
-    else
+    if ! systemctl is-active --quiet postgresql; then
         log_message "WARNING: PostgreSQL not running, skipping database backup"
+        rmdir "$backup_path" 2>/dev/null || true
         return 0
     fi
     
-    if [ -n "$databases" ]; then
-        for db in $databases; do
-            db=$(echo "$db" | xargs)  # Trim whitespace
-            if [ -n "$db" ]; then
-                log_message "Backing up PostgreSQL database: $db"
-                sudo -u postgres pg_dump "$db" > "$backup_path/${{db}}.sql" || handle_error "Failed to backup PostgreSQL database: $db"
-            fi
-        done
-        
-        # Backup globals (users, roles, etc.)
-        log_message "Backing up PostgreSQL globals"
-        sudo -u postgres pg_dumpall --globals-only > "$backup_path/globals.sql" || handle_error "Failed to backup PostgreSQL globals"
-        
-        finalize_backup "$backup_path"
-    else
-        log_message "No PostgreSQL databases found to backup"
-        rmdir "$backup_path" 2>/dev/null || true
+    # Backup globals (users, roles, etc.) first; they are needed to restore any database
+    log_message "Backing up PostgreSQL globals"
+    sudo -u postgres pg_dumpall --globals-only > "$backup_path/globals.sql" || handle_error "Failed to backup PostgreSQL globals"
+    
+    # Stream the database list straight into bounded parallel dumps
+    export -f dump_postgresql_database log_message
+    export LOG_FILE PG_DUMP_JOBS
+    sudo -u postgres psql -At -c "SELECT datname FROM pg_database WHERE NOT datistemplate AND datname <> 'postgres'" \\
+        | xargs -r -P "$MAX_PARALLEL_DBS" -I{} bash -c 'dump_postgresql_database "$1" "$2" || exit 255' _ {} "$backup_path" \\
+        || handle_error "Failed to backup one or more PostgreSQL databases"
+    
+    if ! compgen -G "$backup_path/*.dir" > /dev/null; then
+        log_message "No PostgreSQL databases found, backing up globals only"
     fi
-}}
+    
+    finalize_backup "$backup_path" tar -cf - -C "$(dirname "$backup_path")" "$(basename "$backup_path")" || handle_error "Failed to create PostgreSQL backup archive"
+    rm -rf "$backup_path"
+}
+
+""")
 
-# Function to backup MongoDB databases
-backup_mongodb() {{
+_BACKUP_SH_MONGO_FUNC = _ScriptTemplate("""# Function to backup MongoDB databases
+backup_mongodb() {
     log_message "Starting MongoDB backup"
     
-    local backup_path=$(create_backup_dir "mongodb")
+    local backup_path="$BACKUP_DIR/mongodb/$(date +%Y%m%d_%H%M%S)"
     
     if systemctl is-active --quiet mongod || pgrep mongod > /dev/null; then
         log_message "Backing up MongoDB databases"
-        mongodump --out "$backup_path" || handle_error "Failed to backup MongoDB"
-        finalize_backup "$backup_path"
+        # mongodump streams a single archive to stdout, so nothing is staged on disk;
+        # it is left uncompressed for the configured compressor
+        BACKUP_FORMAT=archive finalize_backup "$backup_path" mongodump --quiet --archive || handle_error "Failed to backup MongoDB"
     else
         log_message "WARNING: MongoDB not running, skipping database backup"
-        rmdir "$backup_path" 2>/dev/null || true
     fi
-}}
+}
+
+""")
+
+_BACKUP_SH_FILES_FUNC = _ScriptTemplate("""# Function to snapshot directories with rsync, hard-linking files that are
+# unchanged since the previous snapshot instead of copying them again
+# Usage: snapshot_files <staging path> <directory relative to />...
+snapshot_files() {
+    local staging_path="$1"
+    shift
+    local snapshot_path="$BACKUP_DIR/files/snapshots/$(basename "$staging_path")"
+    local latest="$BACKUP_DIR/files/latest"
+    local previous=""
+    
+    if [ -L "$latest" ]; then
+        previous="$(readlink -f "$latest")"
+    fi
+    
+    mkdir -p "$snapshot_path"
+    
+    local pids=()
+    local member
+    for member in "$@"; do
+        wait_for_slot || handle_error "Failed to snapshot directory: /$member"
+        mkdir -p "$snapshot_path/$member"
+        if [ -n "$previous" ] && [ -d "$previous/$member" ]; then
+            rsync -aHAX --delete --link-dest="$previous/$member/" "/$member/" "$snapshot_path/$member/" &
+        else
+            rsync -aHAX --delete "/$member/" "$snapshot_path/$member/" &
+        fi
+        pids+=($!)
+    done
+    
+    wait_for_jobs "${pids[@]}" || handle_error "Failed to snapshot one or more directories"
+    
+    if [ -d "$staging_path/docker-volumes" ]; then
+        mv "$staging_path/docker-volumes" "$snapshot_path/"
+    fi
+    
+    # rsync keeps source mtimes, so mark completion time for freshness checks
+    touch "$snapshot_path/.completed"
+    ln -sfn "$snapshot_path" "$latest"
+    
+    # Snapshots are directories of hard links, so they are listed without a digest
+    record_manifest "$snapshot_path" - -
+    
+    log_message "Snapshot created: $snapshot_path"
+}
 
 # Function to backup application files
-backup_files() {{
+backup_files() {
     log_message "Starting file backup"
     
     local backup_path=$(create_backup_dir "files")
@@ -298,10 +335,12 @@ backup_files() {{
         "/var/log/coffeebreak"
     )
     
-    for dir in "${{dirs_to_backup[@]}}"; do
+    # Directories are streamed straight into the archive, without a staging copy
+    local members=()
+    for dir in "${dirs_to_backup[@]}"; do
         if [ -d "$dir" ]; then
             log_message "Backing up directory: $dir"
-            cp -r "$dir" "$backup_path/" || handle_error "Failed to backup directory: $dir"
+            members+=("${dir#/}")
         fi
     done
     
@@ -311,21 +350,48 @@ backup_files() {{
         mkdir -p "$backup_path/docker-volumes"
         
         # Get CoffeeBreak-related volumes
-        local volumes=$(docker volume ls --filter name=coffeebreak --format "{{{{.Name}}}}" 2>/dev/null || echo "")
+        local volumes=$(docker volume ls --filter name=coffeebreak --format "{{.Name}}" 2>/dev/null || echo "")
         
+        local volume_pids=()
         for volume in $volumes; do
             if [ -n "$volume" ]; then
+                wait_for_slot || true
                 log_message "Backing up Docker volume: $volume"
-                docker run --rm -v "$volume:/source" -v "$backup_path/docker-volumes:/backup" ubuntu tar czf "/backup/${{volume}}.tar.gz" -C /source . || log_message "WARNING: Failed to backup volume $volume"
+                docker run --rm -v "$volume:/source" -v "$backup_path/docker-volumes:/backup" ubuntu tar czf "/backup/${volume}.tar.gz" -C /source . &
+                volume_pids+=($!)
             fi
         done
+        
+        wait_for_jobs "${volume_pids[@]}" || log_message "WARNING: Failed to backup one or more Docker volumes"
     fi
     
-    finalize_backup "$backup_path"
-}}
+    if [ "$FILE_BACKUP_MODE" = "link-dest" ]; then
+        snapshot_files "$backup_path" "${members[@]}"
+        rm -rf "$backup_path"
+        return 0
+    fi
+    
+    local tar_args=()
+    if [ ${#members[@]} -gt 0 ]; then
+        tar_args+=(-C / "${members[@]}")
+    fi
+    if [ -d "$backup_path/docker-volumes" ]; then
+        tar_args+=(-C "$backup_path" docker-volumes)
+    fi
+    
+    if [ ${#tar_args[@]} -gt 0 ]; then
+        finalize_backup "$backup_path" tar -cf - "${tar_args[@]}" || handle_error "Failed to create file backup archive"
+    else
+        log_message "No application files found to backup"
+    fi
+    
+    rm -rf "$backup_path"
+}
+
+""")
 
-# Function to backup configuration files
-backup_configs() {{
+_BACKUP_SH_CONFIG_FUNC = _ScriptTemplate("""# Function to backup configuration files
+backup_configs() {
     log_message "Starting configuration backup"
     
     local backup_path=$(create_backup_dir "configs")
@@ -335,94 +401,134 @@ backup_configs() {{
         "/opt/coffeebreak/config"
         "/opt/coffeebreak/.env"
         "/etc/nginx/sites-available/coffeebreak"
-        "/etc/systemd/system/coffeebreak-*"
+        /etc/systemd/system/coffeebreak-*
         "/etc/cron.d/coffeebreak"
         "/etc/logrotate.d/coffeebreak"
     )
     
-    for config in "${{configs_to_backup[@]}}"; do
+    # Configs are streamed into the archive with their absolute-path layout
+    local tar_args=()
+    for config in "${configs_to_backup[@]}"; do
         if [ -e "$config" ]; then
             log_message "Backing up config: $config"
-            
-            # Create directory structure in backup
-            local relative_path="${{config#/}}"
-            local backup_config_path="$backup_path/$relative_path"
-            mkdir -p "$(dirname "$backup_config_path")"
-            
-            cp -r "$config" "$backup_config_path" 2>/dev/null || log_message "WARNING: Failed to backup config: $config"
+            tar_args+=("${config#/}")
         fi
     done
+    if [ ${#tar_args[@]} -gt 0 ]; then
+        tar_args=(-C / "${tar_args[@]}")
+    fi
     
     # Backup Docker Compose files if they exist
     if [ -f "docker-compose.yml" ]; then
         log_message "Backing up Docker Compose configuration"
-        cp docker-compose.yml "$backup_path/" || log_message "WARNING: Failed to backup docker-compose.yml"
+        tar_args+=(-C "$PWD" docker-compose.yml)
+    fi
+    
+    if [ ${#tar_args[@]} -gt 0 ]; then
+        finalize_backup "$backup_path" tar -cf - "${tar_args[@]}" || handle_error "Failed to create configuration backup archive"
+    else
+        log_message "No configuration files found to backup"
     fi
     
-    finalize_backup "$backup_path"
-}}
+    rmdir "$backup_path" 2>/dev/null || true
+}
 
-# Function to cleanup old backups
-cleanup_old_backups() {{
+""")
+
+_BACKUP_SH_CLEANUP_FUNC = _ScriptTemplate("""# Function to cleanup old backups
+cleanup_old_backups() {
     log_message "Cleaning up backups older than $RETENTION_DAYS days"
     
-    find "$BACKUP_DIR" -type f -mtime +$RETENTION_DAYS -delete 2>/dev/null || true
-    find "$BACKUP_DIR" -type d -empty -delete 2>/dev/null || true
+    # Snapshot files keep their source mtimes (and share inodes across
+    # snapshots), so snapshots are expired as whole directories instead
+    local snapshots_dir="$BACKUP_DIR/files/snapshots"
+    if [ -d "$snapshots_dir" ]; then
+        local latest="$(readlink -f "$BACKUP_DIR/files/latest" 2>/dev/null || echo "")"
+        find "$snapshots_dir" -mindepth 1 -maxdepth 1 -type d -mtime +$RETENTION_DAYS -print0 2>/dev/null \\
+            | while IFS= read -r -d '' snapshot; do
+                if [ "$snapshot" != "$latest" ]; then
+                    rm -rf "$snapshot"
+                fi
+            done
+    fi
+    
+    # The storage config written at setup is kept regardless of age. Old pack
+    # files in the repository are still referenced by newer restic snapshots;
+    # restic forget --prune expires the repository below. It is matched by
+    # inode, since BACKUP_DIR may be relative
+    local skip=(-path "$snapshots_dir" -prune -o -path "$BACKUP_DIR/backup-config.json" -prune -o)
+    if [ -n "$DEDUP_REPO" ] && [ -d "$DEDUP_REPO" ]; then
+        skip+=(-samefile "$DEDUP_REPO" -prune -o)
+    fi
+    
+    # Unlink expired files in parallel batches; fall back to a serial delete.
+    # -delete cannot be combined with -prune (it implies -depth), so matches
+    # are handed to rm and rmdir instead
+    if ! find "$BACKUP_DIR" "${skip[@]}" -type f -mtime +$RETENTION_DAYS -print0 2>/dev/null \\
+        | xargs -0 -r -P "$MAX_PARALLEL_JOBS" -n 256 rm -f; then
+        find "$BACKUP_DIR" "${skip[@]}" -type f -mtime +$RETENTION_DAYS -exec rm -f {} + 2>/dev/null || true
+    fi
+    find "$BACKUP_DIR" -mindepth 1 "${skip[@]}" -type d -empty -print0 2>/dev/null \\
+        | xargs -0 -r rmdir 2>/dev/null || true
+    
+    if [ -n "$DEDUP_REPO" ]; then
+        restic forget --quiet --group-by host --keep-within "${RETENTION_DAYS}d" --prune || log_message "WARNING: Failed to prune $DEDUP_REPO"
+    fi
     
     log_message "Backup cleanup completed"
-}}
+}
 
-# Function to verify backup integrity
-verify_backups() {{
+""")
+
+_BACKUP_SH_VERIFY_FUNC = _ScriptTemplate("""# Function to verify backup integrity
+verify_backups() {
     log_message "Verifying recent backups"
     
+    # Only today's manifests are read, so the cost does not grow with retention
     local today=$(date +%Y%m%d)
-    local recent_backups=$(find "$BACKUP_DIR" -name "*$today*" -type f 2>/dev/null || echo "")
+    local manifest backup_file size digest
     
-    for backup_file in $recent_backups; do
-        if [[ "$backup_file" == *.tar.gz ]]; then
-            if tar -tzf "$backup_file" > /dev/null 2>&1; then
-                log_message "✓ Backup verified: $backup_file"
-            else
+    for manifest in "$BACKUP_DIR"/manifests/*-"$today".tsv; do
+        [ -f "$manifest" ] || continue
+        
+        while IFS=$'\\t' read -r backup_file size digest; do
+            if [ "$size" = "restic" ]; then
+                if restic snapshots --tag "$digest" 2>/dev/null | grep -q "$digest"; then
+                    log_message "✓ Repository snapshot verified: $digest"
+                else
+                    log_message "✗ Repository snapshot missing: $digest"
+                fi
+            elif [ "$digest" = "-" ]; then
+                if [ -f "$backup_file/.completed" ]; then
+                    log_message "✓ Snapshot verified: $backup_file"
+                else
+                    log_message "✗ Snapshot incomplete: $backup_file"
+                fi
+            elif [ ! -f "$backup_file" ]; then
+                log_message "✗ Backup missing: $backup_file"
+            elif [ "$(stat -c %s "$backup_file")" != "$size" ] \\
+                || [ "$(sha256sum "$backup_file" | cut -d' ' -f1)" != "$digest" ]; then
                 log_message "✗ Backup corrupted: $backup_file"
-            fi
-        elif [[ "$backup_file" == *.gpg ]]; then
-            if gpg --list-packets "$backup_file" > /dev/null 2>&1; then
-                log_message "✓ Encrypted backup verified: $backup_file"
             else
-                log_message "✗ Encrypted backup corrupted: $backup_file"
+                log_message "✓ Backup verified: $backup_file"
             fi
-        fi
+        done < "$manifest"
     done
-}}
+}
+
+""")
 
-# Main backup function
-main() {{
-    local backup_type="${{1:-incremental}}"
+_BACKUP_SH_MAIN = _ScriptTemplate("""# Main backup function
+main() {
+    local backup_type="${1:-incremental}"
     
     log_message "Starting CoffeeBreak backup (type: $backup_type)"
     
     # Create backup directory structure
-    mkdir -p "$BACKUP_DIR"/{{postgresql,mongodb,files,configs}}
-    
-    # Perform backups based on configuration
-    if [ "{config.get('backup_databases', True)}" = "True" ]; then
-        backup_postgresql
-        backup_mongodb
-    fi
+    mkdir -p "$BACKUP_DIR"/{postgresql,mongodb,files,configs,manifests}
     
-    if [ "{config.get('backup_files', True)}" = "True" ]; then
-        backup_files
-    fi
-    
-    if [ "{config.get('backup_configs', True)}" = "True" ]; then
-        backup_configs
-    fi
-    
-    # Verify backups if enabled
-    if [ "{config.get('verify_backups', True)}" = "True" ]; then
-        verify_backups
-    fi
+    # Backups and verification selected in the configuration
+@@{MAIN_CALLS}
     
     # Cleanup old backups
     cleanup_old_backups
@@ -436,10 +542,10 @@ main() {{
     if [ -f "/opt/coffeebreak/bin/notify.sh" ]; then
         /opt/coffeebreak/bin/notify.sh "Backup Completed" "CoffeeBreak backup completed successfully. Type: $backup_type, Size: $backup_size"
     fi
-}}
+}
 
 # Handle command line arguments
-case "${{1:-incremental}}" in
+case "${1:-incremental}" in
     "incremental"|"full")
         main "$1"
         ;;
@@ -450,167 +556,111 @@ case "${{1:-incremental}}" in
         cleanup_old_backups
         ;;
     *)
-        echo "Usage: $0 {{incremental|full|verify|cleanup}}"
+        echo "Usage: $0 {incremental|full|verify|cleanup}"
         exit 1
         ;;
 esac
-"""
-            
-            backup_script_path = f"{scripts_dir}/backup.sh"
-            with open(backup_script_path, 'w') as f:
-                f.write(backup_script)
-            os.chmod(backup_script_path, 0o755)
-            
-            setup_result['scripts'].append(backup_script_path)
-            
-            if self.verbose:
-                print("Backup scripts created")
-            
-        except Exception as e:
-            setup_result['success'] = False
-            setup_result['errors'].append(f"Backup scripts creation failed: {e}")
-        
-        return setup_result
-    
-    def _setup_backup_verification(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Setup backup verification system."""
-        setup_result = {
-            'success': True,
-            'errors': []
-        }
-        
-        try:
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
-            # Backup verification script
-            verify_script = f"""#!/bin/bash
+""")
+
+# backup.sh is assembled from these fragments in order
+_BACKUP_SH_FRAGMENTS = (
+    _BACKUP_SH_HEAD,
+    _BACKUP_SH_HELPERS,
+    _BACKUP_SH_PG_FUNC,
+    _BACKUP_SH_MONGO_FUNC,
+    _BACKUP_SH_FILES_FUNC,
+    _BACKUP_SH_CONFIG_FUNC,
+    _BACKUP_SH_CLEANUP_FUNC,
+    _BACKUP_SH_VERIFY_FUNC,
+    _BACKUP_SH_MAIN,
+)
+
+_VERIFY_SH_HEAD = _ScriptTemplate("""#!/bin/bash
 # CoffeeBreak Backup Verification Script
 
-BACKUP_DIR="{config.get('backup_dir', '/opt/coffeebreak/backups')}"
+BACKUP_DIR="@@{BACKUP_DIR}"
 LOG_FILE="/var/log/coffeebreak/backup-verify.log"
 
+# Repository backups are checked against the restic repository backup.sh writes to
+export RESTIC_REPOSITORY="@@{DEDUP_REPO}"
+export RESTIC_PASSWORD_FILE="@@{ENCRYPTION_KEY_FILE}"
+
 # Function to log with timestamp
-log_message() {{
+log_message() {
     echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
+}
+
+""")
 
-# Function to verify PostgreSQL backup
-verify_postgresql_backup() {{
+_VERIFY_SH_CHECKS = _ScriptTemplate("""# Function to verify one backup against its manifest entry
+# Usage: verify_backup_entry <path> <size> <sha256>
+verify_backup_entry() {
     local backup_file="$1"
+    local size="$2"
+    local digest="$3"
     
-    log_message "Verifying PostgreSQL backup: $backup_file"
+    log_message "Verifying backup: $backup_file"
     
-    if [[ "$backup_file" == *.sql ]]; then
-        # Check SQL syntax
-        if pg_verifybackup --parse-only "$backup_file" 2>/dev/null; then
-            log_message "✓ PostgreSQL backup syntax valid: $backup_file"
+    if [ "$size" = "restic" ]; then
+        # Repository backups are recorded by their snapshot tag
+        if [ -n "$RESTIC_REPOSITORY" ] && command -v restic &> /dev/null \\
+            && restic snapshots --tag "$digest" 2>/dev/null | grep -q "$digest"; then
+            log_message "✓ Repository snapshot verified: $digest"
             return 0
-        else
-            # Fallback: Basic SQL syntax check
-            if grep -q "CREATE\\|INSERT\\|COPY" "$backup_file"; then
-                log_message "✓ PostgreSQL backup appears valid: $backup_file"
-                return 0
-            else
-                log_message "✗ PostgreSQL backup appears invalid: $backup_file"
-                return 1
-            fi
         fi
+        log_message "✗ Repository snapshot missing: $digest"
+        return 1
     fi
     
-    return 1
-}}
-
-# Function to verify MongoDB backup
-verify_mongodb_backup() {{
-    local backup_dir="$1"
-    
-    log_message "Verifying MongoDB backup: $backup_dir"
-    
-    if [ -d "$backup_dir" ]; then
-        # Check for BSON files
-        local bson_files=$(find "$backup_dir" -name "*.bson" | wc -l)
-        if [ "$bson_files" -gt 0 ]; then
-            log_message "✓ MongoDB backup contains $bson_files BSON files: $backup_dir"
+    if [ "$digest" = "-" ]; then
+        # Snapshots are directories of hard links, marked once rsync completed
+        if [ -f "$backup_file/.completed" ]; then
+            log_message "✓ Snapshot verified: $backup_file"
             return 0
-        else
-            log_message "✗ MongoDB backup contains no BSON files: $backup_dir"
-            return 1
         fi
+        log_message "✗ Snapshot incomplete: $backup_file"
+        return 1
     fi
     
-    return 1
-}}
-
-# Function to verify file backup integrity
-verify_file_backup() {{
-    local backup_file="$1"
-    
-    log_message "Verifying file backup: $backup_file"
+    if [ ! -f "$backup_file" ]; then
+        log_message "✗ Backup missing: $backup_file"
+        return 1
+    fi
     
-    if [[ "$backup_file" == *.tar.gz ]]; then
-        if tar -tzf "$backup_file" > /dev/null 2>&1; then
-            log_message "✓ File backup archive valid: $backup_file"
-            return 0
-        else
-            log_message "✗ File backup archive corrupted: $backup_file"
-            return 1
-        fi
-    elif [[ "$backup_file" == *.gpg ]]; then
-        if gpg --list-packets "$backup_file" > /dev/null 2>&1; then
-            log_message "✓ Encrypted backup valid: $backup_file"
-            return 0
-        else
-            log_message "✗ Encrypted backup corrupted: $backup_file"
-            return 1
-        fi
+    if [ "$(stat -c %s "$backup_file")" != "$size" ] \\
+        || [ "$(sha256sum "$backup_file" | cut -d' ' -f1)" != "$digest" ]; then
+        log_message "✗ Backup corrupted: $backup_file"
+        return 1
     fi
     
-    return 1
-}}
+    log_message "✓ Backup verified: $backup_file"
+    return 0
+}
 
-# Main verification function
-main() {{
-    local backup_date="${{1:-$(date +%Y%m%d)}}"
+""")
+
+_VERIFY_SH_MAIN = _ScriptTemplate("""# Main verification function
+main() {
+    local backup_date="${1:-$(date +%Y%m%d)}"
     
     log_message "Starting backup verification for date: $backup_date"
     
     local total_verified=0
     local total_failed=0
+    local manifest backup_file size digest
     
-    # Verify PostgreSQL backups
-    for backup_file in "$BACKUP_DIR"/postgresql/*"$backup_date"*; do
-        if [ -f "$backup_file" ]; then
-            if verify_postgresql_backup "$backup_file"; then
-                ((total_verified++))
-            else
-                ((total_failed++))
-            fi
-        fi
-    done
-    
-    # Verify MongoDB backups
-    for backup_dir in "$BACKUP_DIR"/mongodb/*"$backup_date"*; do
-        if [ -d "$backup_dir" ]; then
-            if verify_mongodb_backup "$backup_dir"; then
-                ((total_verified++))
-            else
-                ((total_failed++))
-            fi
-        fi
-    done
-    
-    # Verify file backups
-    for backup_file in "$BACKUP_DIR"/files/*"$backup_date"* "$BACKUP_DIR"/configs/*"$backup_date"*; do
-        if [ -f "$backup_file" ]; then
-            if verify_file_backup "$backup_file"; then
+    # The day's manifests list every backup written that day with its size and
+    # checksum, so exactly those backups are checked and nothing else is globbed
+    for manifest in "$BACKUP_DIR"/manifests/*-"$backup_date".tsv; do
+        [ -f "$manifest" ] || continue
+        
+        while IFS=$'\\t' read -r backup_file size digest; do
+            if verify_backup_entry "$backup_file" "$size" "$digest"; then
                 ((total_verified++))
             else
                 ((total_failed++))
             fi
-        fi
+        done < "$manifest"
     done
     
     log_message "Backup verification completed: $total_verified verified, $total_failed failed"
@@ -621,54 +671,33 @@ main() {{
     fi
     
     exit $total_failed
-}}
+}
 
 main "$@"
-"""
-            
-            verify_script_path = f"{scripts_dir}/verify-backup.sh"
-            with open(verify_script_path, 'w') as f:
-                f.write(verify_script)
-            os.chmod(verify_script_path, 0o755)
-            
-            if self.verbose:
-                print("Backup verification system configured")
-            
-        except Exception as e:
-            setup_result['success'] = False
-            setup_result['errors'].append(f"Backup verification setup failed: {e}")
-        
-        return setup_result
-    
-    def _setup_backup_monitoring(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Setup backup monitoring and alerting."""
-        setup_result = {
-            'success': True,
-            'errors': []
-        }
-        
-        try:
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
-            # Backup monitoring script
-            monitor_script = f"""#!/bin/bash
+""")
+
+# verify-backup.sh is assembled from these fragments in order
+_VERIFY_SH_FRAGMENTS = (
+    _VERIFY_SH_HEAD,
+    _VERIFY_SH_CHECKS,
+    _VERIFY_SH_MAIN,
+)
+
+_MONITOR_SH_HEAD = _ScriptTemplate("""#!/bin/bash
 # CoffeeBreak Backup Monitoring Script
 
-BACKUP_DIR="{config.get('backup_dir', '/opt/coffeebreak/backups')}"
+BACKUP_DIR="@@{BACKUP_DIR}"
 LOG_FILE="/var/log/coffeebreak/backup-monitor.log"
-ALERT_EMAIL="{config.get('alert_email', 'admin@localhost')}"
+ALERT_EMAIL="@@{ALERT_EMAIL}"
 MAX_BACKUP_AGE_HOURS=25  # Alert if no backup in 25 hours
 
 # Function to log with timestamp
-log_message() {{
+log_message() {
     echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
+}
 
 # Function to send alert
-send_alert() {{
+send_alert() {
     local subject="$1"
     local message="$2"
     
@@ -686,64 +715,81 @@ send_alert() {{
     
     # Log to syslog
     logger -t coffeebreak-backup "ALERT: $subject - $message"
-}}
+}
 
-# Function to check backup freshness
-check_backup_freshness() {{
+""")
+
+_MONITOR_SH_CHECKS = _ScriptTemplate("""# Function to check backup freshness
+check_backup_freshness() {
     log_message "Checking backup freshness"
     
-    local current_time=$(date +%s)
-    local max_age_seconds=$((MAX_BACKUP_AGE_HOURS * 3600))
-    
-    # Check for recent backups in each category
-    local categories=("postgresql" "mongodb" "files" "configs")
+    local status category hours
     local stale_categories=()
     
-    for category in "${{categories[@]}}"; do
-        local category_dir="$BACKUP_DIR/$category"
-        
-        if [ -d "$category_dir" ]; then
-            local latest_backup=$(find "$category_dir" -type f -printf '%T@ %p
-' 2>/dev/null | sort -n | tail -1 | cut -d' ' -f2-)
-            
-            if [ -n "$latest_backup" ]; then
-                local backup_time=$(stat -c %Y "$latest_backup" 2>/dev/null || echo 0)
-                local age_seconds=$((current_time - backup_time))
-                
-                if [ "$age_seconds" -gt "$max_age_seconds" ]; then
-                    stale_categories+=("$category")
-                    log_message "WARNING: Stale backup in category $category ($(( age_seconds / 3600 )) hours old)"
-                else
-                    log_message "✓ Fresh backup found in category $category"
-                fi
-            else
+    # A single listing of the category directories and the manifests; awk keeps
+    # the newest manifest mtime per category and prints one status line for each
+    while read -r status category hours; do
+        case "$status" in
+            FRESH)
+                log_message "✓ Fresh backup found in category $category"
+                ;;
+            STALE)
+                stale_categories+=("$category")
+                log_message "WARNING: Stale backup in category $category ($hours hours old)"
+                ;;
+            EMPTY)
                 stale_categories+=("$category")
                 log_message "WARNING: No backups found in category $category"
-            fi
-        else
-            log_message "WARNING: Backup category directory missing: $category_dir"
-        fi
-    done
-    
-    if [ ${{#stale_categories[@]}} -gt 0 ]; then
-        send_alert "Stale Backups Detected" "The following backup categories are stale: ${{stale_categories[*]}}"
+                ;;
+            MISSING)
+                log_message "WARNING: Backup category directory missing: $BACKUP_DIR/$category"
+                ;;
+        esac
+    done < <(find "$BACKUP_DIR" -mindepth 1 -maxdepth 2 \\( -type d -o -path "$BACKUP_DIR/manifests/*.tsv" \\) -printf '%y\\t%T@\\t%P\\n' 2>/dev/null \\
+        | awk -F'\\t' -v now="$(date +%s)" -v max_age=$((MAX_BACKUP_AGE_HOURS * 3600)) '
+            BEGIN { n = split("postgresql mongodb files configs", order, " ") }
+            $1 == "d" { if (index($3, "/") == 0) dirs[$3] = 1; next }
+            { category = $3; sub("^manifests/", "", category); sub("-[0-9]+[.]tsv$", "", category) }
+            !(category in latest) || $2 + 0 > latest[category] { latest[category] = $2 + 0 }
+            END {
+                for (i = 1; i <= n; i++) {
+                    c = order[i]
+                    if (!(c in dirs)) print "MISSING", c
+                    else if (!(c in latest)) print "EMPTY", c
+                    else if (now - latest[c] > max_age) print "STALE", c, int((now - latest[c]) / 3600)
+                    else print "FRESH", c
+                }
+            }')
+    
+    if [ ${#stale_categories[@]} -gt 0 ]; then
+        send_alert "Stale Backups Detected" "The following backup categories are stale: ${stale_categories[*]}"
     fi
-}}
+}
 
 # Function to check backup sizes
-check_backup_sizes() {{
+check_backup_sizes() {
     log_message "Checking backup sizes"
     
     local today=$(date +%Y%m%d)
     local yesterday=$(date -d "yesterday" +%Y%m%d)
     
-    # Get today's backup size
-    local today_size=$(find "$BACKUP_DIR" -name "*$today*" -type f -exec du -cb {{}} + 2>/dev/null | tail -1 | cut -f1 || echo 0)
+    local today_size=0 yesterday_size=0 today_count=0
+    local manifests=()
+    local manifest
+    
+    # Both days' sizes come from the manifests in one awk pass,
+    # instead of walking the whole backup tree once per day
+    for manifest in "$BACKUP_DIR"/manifests/*-"$today".tsv "$BACKUP_DIR"/manifests/*-"$yesterday".tsv; do
+        [ -f "$manifest" ] && manifests+=("$manifest")
+    done
     
-    # Get yesterday's backup size
-    local yesterday_size=$(find "$BACKUP_DIR" -name "*$yesterday*" -type f -exec du -cb {{}} + 2>/dev/null | tail -1 | cut -f1 || echo 0)
+    read -r today_size yesterday_size today_count < <(awk -F'\\t' -v today="-$today.tsv" '
+        { is_today = substr(FILENAME, length(FILENAME) - length(today) + 1) == today }
+        is_today { count++ }
+        $2 ~ /^[0-9]+$/ { if (is_today) t += $2; else y += $2 }
+        END { printf "%d %d %d\\n", t, y, count }' "${manifests[@]}" < /dev/null)
     
-    if [ "$today_size" -eq 0 ]; then
+    if [ "$today_count" -eq 0 ]; then
         send_alert "No Backups Today" "No backups found for today ($today)"
     elif [ "$yesterday_size" -gt 0 ]; then
         # Check for significant size difference (more than 50% change)
@@ -757,15 +803,15 @@ check_backup_sizes() {{
     fi
     
     log_message "Today's backup size: $today_size bytes"
-}}
+}
 
 # Function to check disk space
-check_disk_space() {{
+check_disk_space() {
     log_message "Checking backup disk space"
     
     local backup_fs=$(df "$BACKUP_DIR" | tail -1)
-    local usage_percent=$(echo "$backup_fs" | awk '{{print $5}}' | sed 's/%//')
-    local available_gb=$(echo "$backup_fs" | awk '{{print int($4/1024/1024)}}')
+    local usage_percent=$(echo "$backup_fs" | awk '{print $5}' | sed 's/%//')
+    local available_gb=$(echo "$backup_fs" | awk '{print int($4/1024/1024)}')
     
     if [ "$usage_percent" -gt 90 ]; then
         send_alert "Backup Disk Space Critical" "Backup filesystem is $usage_percent% full ($available_gb GB available)"
@@ -774,10 +820,10 @@ check_disk_space() {{
     else
         log_message "✓ Backup disk space OK: $usage_percent% used ($available_gb GB available)"
     fi
-}}
+}
 
 # Function to verify backup processes
-check_backup_processes() {{
+check_backup_processes() {
     log_message "Checking backup processes"
     
     # Check if backup is currently running
@@ -788,7 +834,7 @@ check_backup_processes() {{
         
         # Check if backup has been running too long (more than 4 hours)
         for pid in $backup_pids; do
-            local start_time=$(ps -o lstart= -p "$pid" 2>/dev/null | xargs -I{{}} date -d{{}} +%s || echo 0)
+            local start_time=$(ps -o lstart= -p "$pid" 2>/dev/null | xargs -I{} date -d{} +%s || echo 0)
             local current_time=$(date +%s)
             local runtime_hours=$(( (current_time - start_time) / 3600 ))
             
@@ -797,10 +843,12 @@ check_backup_processes() {{
             fi
         done
     fi
-}}
+}
+
+""")
 
-# Main monitoring function
-main() {{
+_MONITOR_SH_MAIN = _ScriptTemplate("""# Main monitoring function
+main() {
     log_message "Starting backup monitoring check"
     
     check_backup_freshness
@@ -809,31 +857,331 @@ main() {{
     check_backup_processes
     
     log_message "Backup monitoring check completed"
-}}
+}
 
 main "$@"
-"""
+""")
+
+# monitor-backup.sh is assembled from these fragments in order
+_MONITOR_SH_FRAGMENTS = (
+    _MONITOR_SH_HEAD,
+    _MONITOR_SH_CHECKS,
+    _MONITOR_SH_MAIN,
+)
+
+
+def _config_flag(value: Any) -> bool:
+    """Interpret a config flag, accepting the usual string spellings."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def _shell_bool(value: Any) -> str:
+    """Normalize a config flag to the 'true'/'false' literals compared in bash."""
+    return 'true' if _config_flag(value) else 'false'
+
+
+def _main_calls(config: Dict[str, Any]) -> str:
+    """Render the backup.sh main() calls for the steps enabled in config."""
+    calls = []
+    if _config_flag(config.get('backup_databases', True)):
+        calls += ['backup_postgresql', 'backup_mongodb']
+    if _config_flag(config.get('backup_files', True)):
+        calls.append('backup_files')
+    if _config_flag(config.get('backup_configs', True)):
+        calls.append('backup_configs')
+    if _config_flag(config.get('verify_backups', True)):
+        calls.append('verify_backups')
+    
+    if not calls:
+        return '    log_message "No backup steps enabled"'
+    return '\n'.join(f'    {call}' for call in calls)
+
+
+def _render_script(fragments: Tuple[Template, ...], mapping: Dict[str, Any]) -> str:
+    """Substitute mapping into each script fragment and join them in order."""
+    buf = io.StringIO()
+    buf.writelines(fragment.substitute(mapping) for fragment in fragments)
+    return buf.getvalue()
+
+
+class BackupManager:
+    """Manages backup operations for production deployments."""
+    
+    def __init__(self, 
+                 deployment_type: str = "docker",
+                 verbose: bool = False):
+        """
+        Initialize backup manager.
+        
+        Args:
+            deployment_type: Type of deployment (docker, standalone)
+            verbose: Enable verbose output
+        """
+        self.deployment_type = deployment_type
+        self.verbose = verbose
+        
+        # Initialize components
+        self.scheduler = BackupScheduler(deployment_type=deployment_type, verbose=verbose)
+        self.recovery = RecoveryManager(deployment_type=deployment_type, verbose=verbose)
+        self.storage = BackupStorage(deployment_type=deployment_type, verbose=verbose)
+    
+    def setup_backup_system(self, 
+                           domain: str,
+                           backup_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Set up comprehensive backup system.
+        
+        Args:
+            domain: Production domain
+            backup_config: Optional backup configuration
             
-            monitor_script_path = f"{scripts_dir}/monitor-backup.sh"
-            with open(monitor_script_path, 'w') as f:
-                f.write(monitor_script)
-            os.chmod(monitor_script_path, 0o755)
+        Returns:
+            Dict[str, Any]: Setup results
+        """
+        try:
+            if self.verbose:
+                print(f"Setting up backup system for {domain}")
+            
+            setup_result = {
+                'success': True,
+                'domain': domain,
+                'deployment_type': self.deployment_type,
+                'components_setup': [],
+                'errors': [],
+                'backup_location': None,
+                'recovery_scripts': [],
+                'encryption_key_file': None
+            }
             
-            # Setup cron job for backup monitoring
-            cron_entry = f"0 */6 * * * {monitor_script_path}"
+            # Default backup configuration
+            config = {
+                'domain': domain,
+                'retention_days': 30,
+                'backup_schedule': '0 2 * * *',  # Daily at 2 AM
+                'full_backup_schedule': '0 3 * * 0',  # Weekly on Sunday at 3 AM
+                'enable_encryption': True,
+                'enable_compression': True,
+                'compressor': 'pigz',
+                'file_backup_mode': 'archive',
+                'pg_parallel_dbs': 2,
+                'pg_dump_jobs': 4,
+                'dedup_repo': None,
+                'backup_databases': True,
+                'backup_files': True,
+                'backup_configs': True,
+                'remote_storage': False,
+                'verify_backups': True
+            }
+            
+            if backup_config:
+                config.update(backup_config)
+            
+            # Storage and scheduling queue their cron changes here; the crontab
+            # is read once now and installed once after all steps ran
+            cron = CronManager(verbose=self.verbose)
+            cron.load()
+            
+            # Storage creates backup_dir and sets its owner and mode, so it
+            # finishes before any other step writes under it
+            results = [('backup_storage', self.storage.setup_backup_storage(config, cron))]
+            
+            steps = [
+                ('backup_scripts', lambda: self._create_backup_scripts(domain, config)),
+                ('backup_scheduling', lambda: self.scheduler.setup_backup_schedule(domain, config, cron)),
+                ('recovery_procedures', lambda: self.recovery.setup_recovery_procedures(domain, config)),
+                ('backup_verification', lambda: self._setup_backup_verification(domain, config)),
+                ('backup_monitoring', lambda: self._setup_backup_monitoring(domain, config)),
+            ]
+            
+            # The remaining steps are independent and mostly I/O bound; results
+            # are collected in submission order so components_setup stays stable
+            with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+                futures = [(component, executor.submit(func)) for component, func in steps]
+                results += [(component, future.result()) for component, future in futures]
             
             try:
-                current_crontab = subprocess.run(['crontab', '-l'], 
-                                               capture_output=True, text=True)
-                crontab_content = current_crontab.stdout if current_crontab.returncode == 0 else ""
-            except:
-                crontab_content = ""
-            
-            if "monitor-backup.sh" not in crontab_content:
-                new_crontab = crontab_content.rstrip() + "\n" + cron_entry + "\n"
-                process = subprocess.Popen(['crontab', '-'], 
-                                         stdin=subprocess.PIPE, text=True)
-                process.communicate(input=new_crontab)
+                cron.save()
+            except ConfigurationError as e:
+                setup_result['errors'].append(str(e))
+            
+            for component, component_setup in results:
+                if not component_setup['success']:
+                    setup_result['errors'].extend(component_setup['errors'])
+                    continue
+                
+                setup_result['components_setup'].append(component)
+                if component == 'backup_storage':
+                    setup_result['backup_location'] = component_setup.get('backup_path')
+                elif component == 'backup_scripts':
+                    setup_result['recovery_scripts'] = component_setup.get('scripts', [])
+                    setup_result['encryption_key_file'] = component_setup.get('encryption_key_file')
+            
+            setup_result['success'] = len(setup_result['errors']) == 0
+            
+            if self.verbose:
+                if setup_result['success']:
+                    print(f"Backup system setup completed successfully for {domain}")
+                    print(f"Components: {', '.join(setup_result['components_setup'])}")
+                else:
+                    print(f"Backup system setup completed with {len(setup_result['errors'])} errors")
+            
+            return setup_result
+            
+        except Exception as e:
+            raise ConfigurationError(f"Failed to setup backup system: {e}")
+    
+    def _create_backup_scripts(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Create backup scripts."""
+        setup_result = {
+            'success': True,
+            'errors': [],
+            'scripts': [],
+            'encryption_key_file': None
+        }
+        
+        try:
+            if self.deployment_type == 'standalone':
+                scripts_dir = "/opt/coffeebreak/bin"
+                backup_dir = f"/opt/coffeebreak/backups"
+            else:
+                scripts_dir = "./scripts"
+                backup_dir = "./backups"
+            
+            # restic always encrypts, so a dedup repository needs the key as well
+            dedup_repo = dedup_repo_path(config)
+            
+            key_file = encryption_key_path(self.deployment_type, config)
+            if _config_flag(config.get('enable_encryption', True)) or dedup_repo:
+                self._ensure_encryption_key(key_file)
+                setup_result['encryption_key_file'] = key_file
+            
+            compressor = config.get('compressor', 'pigz')
+            if compressor not in _COMPRESSORS:
+                raise ValueError(f"Unsupported compressor: {compressor}")
+            compress_program, archive_ext = _COMPRESSORS[compressor]
+            
+            file_backup_mode = config.get('file_backup_mode', 'archive')
+            if file_backup_mode not in ('archive', 'link-dest'):
+                raise ValueError(f"Unsupported file backup mode: {file_backup_mode}")
+            # Snapshots are plain directory trees that rsync hard-links between
+            # runs, so there is nothing to encrypt them with
+            if file_backup_mode == 'link-dest' and _config_flag(config.get('enable_encryption', True)):
+                raise ValueError("file_backup_mode 'link-dest' stores unencrypted snapshots; "
+                                 "set enable_encryption to false to use it")
+            
+            os.makedirs(scripts_dir, exist_ok=True)
+            os.makedirs(backup_dir, exist_ok=True)
+            
+            # Main backup script
+            # All values are normalized to the strings the script compares against
+            mapping = {
+                'DOMAIN': domain,
+                'GENERATED': datetime.now().isoformat(),
+                'BACKUP_DIR': backup_dir,
+                'ENCRYPTION_KEY_FILE': key_file,
+                'RETENTION_DAYS': int(config.get('retention_days', 30)),
+                'ENABLE_ENCRYPTION': _shell_bool(config.get('enable_encryption', True)),
+                'ENABLE_COMPRESSION': _shell_bool(config.get('enable_compression', True)),
+                'MAX_PARALLEL_DBS': max(1, int(config.get('pg_parallel_dbs', 2))),
+                'PG_DUMP_JOBS': int(config.get('pg_dump_jobs', 4)),
+                'COMPRESS_PROGRAM': compress_program,
+                'ARCHIVE_EXT': archive_ext,
+                'FILE_BACKUP_MODE': file_backup_mode,
+                'DEDUP_REPO': dedup_repo,
+                'MAIN_CALLS': _main_calls(config),
+            }
+            backup_script = _render_script(_BACKUP_SH_FRAGMENTS, mapping)
+            
+            backup_script_path = f"{scripts_dir}/backup.sh"
+            write_exec_script(backup_script_path, backup_script)
+            
+            setup_result['scripts'].append(backup_script_path)
+            
+            if self.verbose:
+                print("Backup scripts created")
+            
+        except Exception as e:
+            setup_result['success'] = False
+            setup_result['errors'].append(f"Backup scripts creation failed: {e}")
+        
+        return setup_result
+    
+    def _ensure_encryption_key(self, key_file: str) -> None:
+        """Create the backup encryption key file (mode 0600) if it does not exist."""
+        if os.path.exists(key_file):
+            return
+        
+        os.makedirs(os.path.dirname(key_file), exist_ok=True)
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_urlsafe(48) + "\n")
+        
+        if self.verbose:
+            print(f"Backup encryption key created: {key_file}")
+    
+    def _setup_backup_verification(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Setup backup verification system."""
+        setup_result = {
+            'success': True,
+            'errors': []
+        }
+        
+        try:
+            if self.deployment_type == 'standalone':
+                scripts_dir = "/opt/coffeebreak/bin"
+            else:
+                scripts_dir = "./scripts"
+            
+            os.makedirs(scripts_dir, exist_ok=True)
+            
+            # Backup verification script
+            mapping = {
+                'BACKUP_DIR': config.get('backup_dir', '/opt/coffeebreak/backups'),
+                'DEDUP_REPO': dedup_repo_path(config),
+                'ENCRYPTION_KEY_FILE': encryption_key_path(self.deployment_type, config),
+            }
+            verify_script = _render_script(_VERIFY_SH_FRAGMENTS, mapping)
+            
+            verify_script_path = f"{scripts_dir}/verify-backup.sh"
+            write_exec_script(verify_script_path, verify_script)
+            
+            if self.verbose:
+                print("Backup verification system configured")
+            
+        except Exception as e:
+            setup_result['success'] = False
+            setup_result['errors'].append(f"Backup verification setup failed: {e}")
+        
+        return setup_result
+    
+    def _setup_backup_monitoring(self, 
+                                 domain: str, 
+                                 config: Dict[str, Any]) -> Dict[str, Any]:
+        """Setup backup monitoring and alerting."""
+        setup_result = {
+            'success': True,
+            'errors': []
+        }
+        
+        try:
+            if self.deployment_type == 'standalone':
+                scripts_dir = "/opt/coffeebreak/bin"
+            else:
+                scripts_dir = "./scripts"
+            
+            os.makedirs(scripts_dir, exist_ok=True)
+            
+            # Backup monitoring script
+            mapping = {
+                'BACKUP_DIR': config.get('backup_dir', '/opt/coffeebreak/backups'),
+                'ALERT_EMAIL': config.get('alert_email', 'admin@localhost'),
+            }
+            monitor_script = _render_script(_MONITOR_SH_FRAGMENTS, mapping)
+            
+            monitor_script_path = f"{scripts_dir}/monitor-backup.sh"
+            write_exec_script(monitor_script_path, monitor_script)
             
             if self.verbose:
                 print("Backup monitoring configured")
@@ -1,15 +1,169 @@
 """Backup scheduling system for automated backups."""
 
 import os
+import re
+import shlex
 import subprocess
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 from ..utils.errors import ConfigurationError
+from .cron import CronManager
+from .files import atomic_write_all, render_script, write_exec_script
+
+
+# Schedules used when the configuration sets none
+_DEFAULT_INCREMENTAL_SCHEDULE = '0 2 * * *'  # Daily at 2 AM
+_DEFAULT_FULL_SCHEDULE = '0 3 * * 0'  # Weekly on Sunday at 3 AM
+
+# Scripts started by the backup cron jobs
+_JOB_SCRIPTS = ('backup-scheduler.sh', 'verify-backup.sh', 'monitor-backup.sh')
+
+# Five numeric cron fields, the syntax the dispatcher script can evaluate
+_NUMERIC_SCHEDULE = re.compile(r'^[0-9*/,-]+( [0-9*/,-]+){4}$')
+
+# One comma-separated item of a cron field: *, N, N-M or a name, with an optional /step
+_CRON_ITEM = re.compile(r'^(?:\*|([0-9a-z]+)(?:-([0-9a-z]+))?)(?:/([0-9]+))?$')
+
+_WEEKDAYS = ('Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat')
+_MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+# Name, allowed range and value names of the five cron fields
+_CRON_FIELDS = (
+    ('minute', 0, 59, {}),
+    ('hour', 0, 23, {}),
+    ('day of month', 1, 31, {}),
+    ('month', 1, 12, {name: index + 1 for index, name in enumerate(_MONTHS)}),
+    ('day of week', 0, 7, {name.lower(): index for index, name in enumerate(_WEEKDAYS)}),
+)
+
+# systemd equivalents of the cron schedule macros (cron's week starts on Sunday)
+_CRON_MACROS = {
+    '@hourly': '*-*-* *:00:00',
+    '@daily': '*-*-* 00:00:00',
+    '@midnight': '*-*-* 00:00:00',
+    '@weekly': 'Sun *-*-* 00:00:00',
+    '@monthly': '*-*-01 00:00:00',
+    '@yearly': '*-01-01 00:00:00',
+    '@annually': '*-01-01 00:00:00',
+}
+
+
+def _cron_field_values(field: str, index: int) -> List[int]:
+    """Expand one cron field into the sorted values it matches.
+    
+    Raises:
+        ConfigurationError: If the field is not valid cron syntax
+    """
+    name, low, high, names = _CRON_FIELDS[index]
+    values = set()
+    
+    for item in field.lower().split(','):
+        match = _CRON_ITEM.match(item)
+        if not match:
+            raise ConfigurationError(f"Invalid cron {name} field: {field!r}")
+        
+        start, end, step = match.groups()
+        try:
+            if start is None:
+                first, last = low, high
+            else:
+                first = int(start) if start.isdigit() else names[start]
+                if end:
+                    last = int(end) if end.isdigit() else names[end]
+                else:
+                    # "N/step" runs from N to the end of the range
+                    last = high if step else first
+        except KeyError:
+            raise ConfigurationError(f"Invalid cron {name} field: {field!r}") from None
+        
+        if not low <= first <= last <= high or step == '0':
+            raise ConfigurationError(f"Invalid cron {name} field: {field!r}")
+        
+        values.update(range(first, last + 1, int(step or 1)))
+    
+    if index == 4:
+        # Sunday is both 0 and 7
+        values = {value % 7 for value in values}
+    
+    return sorted(values)
+
+
+def _cron_to_oncalendar(schedule: str) -> List[str]:
+    """
+    Translate a cron schedule into systemd OnCalendar expressions.
+    
+    Cron runs a job when either a restricted day of month or a restricted
+    day of week matches, while systemd requires both; such schedules become
+    two expressions, one per day field.
+    
+    Args:
+        schedule: Five-field cron expression or cron macro such as @daily
+        
+    Returns:
+        List[str]: OnCalendar values that together match the schedule
+        
+    Raises:
+        ConfigurationError: If the schedule is not valid cron syntax
+    """
+    schedule = ' '.join(schedule.split())
+    if schedule.startswith('@'):
+        if schedule not in _CRON_MACROS:
+            raise ConfigurationError(f"Unsupported cron schedule: {schedule!r}")
+        return [_CRON_MACROS[schedule]]
+    
+    fields = schedule.split(' ')
+    if len(fields) != 5:
+        raise ConfigurationError(f"Invalid cron schedule {schedule!r}: expected 5 fields")
+    
+    minute, hour, dom, month, dow = (_cron_field_values(field, index) for index, field in enumerate(fields))
+    
+    def calendar_field(values: List[int], index: int) -> str:
+        _, low, high, _ = _CRON_FIELDS[index]
+        if values == list(range(low, high + 1)):
+            return '*'
+        return ','.join(f"{value:02d}" for value in values)
+    
+    time = f"{calendar_field(hour, 1)}:{calendar_field(minute, 0)}:00"
+    months = calendar_field(month, 3)
+    days = calendar_field(dom, 2)
+    weekdays = '' if dow == list(range(7)) else ','.join(_WEEKDAYS[value] for value in dow) + ' '
+    
+    # As in cron, the day fields only combine with OR when neither starts with *
+    if fields[2].startswith('*') or fields[4].startswith('*'):
+        return [f"{weekdays}*-{months}-{days} {time}"]
+    
+    return [f"*-{months}-{days} {time}", f"{weekdays}*-{months}-* {time}"]
+
+
+def _dispatch_schedule(schedules: List[str]) -> str:
+    """Build a cron schedule that fires at least whenever any of the given schedules does."""
+    fields = [schedule.split() for schedule in schedules]
+    
+    def union(index: int) -> str:
+        values = [job_fields[index] for job_fields in fields]
+        return '*' if '*' in values else ','.join(dict.fromkeys(values))
+    
+    if all(job_fields[4] == '*' for job_fields in fields):
+        dom, dow = union(2), '*'
+    elif all(job_fields[2] == '*' for job_fields in fields):
+        dom, dow = '*', union(4)
+    else:
+        # Cron ORs restricted day-of-month and day-of-week fields, so mixed
+        # restrictions cannot be merged; fire daily and let the dispatcher decide
+        dom, dow = '*', '*'
+    
+    return f"{union(0)} {union(1)} {dom} {union(3)} {dow}"
 
 
 class BackupScheduler:
-    """Manages backup scheduling and automation."""
+    """
+    Manages backup scheduling and automation.
+    
+    Used as a context manager, the scheduler reads the crontab once and
+    installs the changes of every setup_backup_schedule call made inside
+    the block with a single write on exit (or on flush()).
+    """
     
     def __init__(self, 
                  deployment_type: str = "docker",
@@ -23,18 +177,64 @@ class BackupScheduler:
         """
         self.deployment_type = deployment_type
         self.verbose = verbose
+        self._cron: Optional[CronManager] = None
+    
+    def __enter__(self) -> "BackupScheduler":
+        self._cron = CronManager(verbose=self.verbose)
+        self._cron.load()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self._cron = None
+    
+    def flush(self) -> None:
+        """
+        Install the cron changes collected since entering the context.
+        
+        Raises:
+            ConfigurationError: If the crontab cannot be installed
+        """
+        if self._cron is not None:
+            self._cron.save()
     
-    def setup_backup_schedule(self, domain: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def setup_backup_schedule(self, 
+                              domain: str, 
+                              config: Dict[str, Any],
+                              cron: Optional[CronManager] = None) -> Dict[str, Any]:
         """
         Setup automated backup scheduling.
         
         Args:
             domain: Production domain
             config: Backup configuration
+            cron: Shared crontab editor; when omitted the scheduler's own
+                  context is used, or else the crontab is read and
+                  installed by this call
             
         Returns:
             Dict[str, Any]: Setup results
         """
+        # Reject malformed schedules before any file or crontab is touched
+        try:
+            _cron_to_oncalendar(config.get('backup_schedule', _DEFAULT_INCREMENTAL_SCHEDULE))
+            _cron_to_oncalendar(config.get('full_backup_schedule', _DEFAULT_FULL_SCHEDULE))
+        except ConfigurationError as e:
+            return {'success': False, 'errors': [str(e)], 'scheduled_jobs': []}
+        
+        if cron is None:
+            cron = self._cron
+        
+        if cron is None:
+            try:
+                with CronManager(verbose=self.verbose) as own_cron:
+                    return self.setup_backup_schedule(domain, config, own_cron)
+            except ConfigurationError as e:
+                return {'success': False, 'errors': [str(e)], 'scheduled_jobs': []}
+        
         setup_result = {
             'success': True,
             'errors': [],
@@ -47,11 +247,13 @@ class BackupScheduler:
             else:
                 scripts_dir = "./scripts"
             
+            os.makedirs(scripts_dir, exist_ok=True)
+            
             # Create scheduler script
             scheduler_script = self._create_scheduler_script(domain, config, scripts_dir)
             
             # Setup cron jobs
-            cron_setup = self._setup_cron_jobs(domain, config, scripts_dir)
+            cron_setup = self._setup_cron_jobs(domain, config, scripts_dir, cron)
             if cron_setup['success']:
                 setup_result['scheduled_jobs'] = cron_setup['jobs']
             else:
@@ -76,159 +278,41 @@ class BackupScheduler:
     
     def _create_scheduler_script(self, domain: str, config: Dict[str, Any], scripts_dir: str) -> str:
         """Create backup scheduler script."""
-        scheduler_script = f"""#!/bin/bash
-# CoffeeBreak Backup Scheduler Script
-# Domain: {domain}
-# Generated: {datetime.now().isoformat()}
-
-set -euo pipefail
-
-BACKUP_SCRIPT="{scripts_dir}/backup.sh"
-LOG_FILE="/var/log/coffeebreak/backup-scheduler.log"
-
-# Function to log with timestamp
-log_message() {{
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
-
-# Function to run backup with proper logging
-run_backup() {{
-    local backup_type="$1"
-    
-    log_message "Starting scheduled backup (type: $backup_type)"
-    
-    if [ -f "$BACKUP_SCRIPT" ]; then
-        if "$BACKUP_SCRIPT" "$backup_type" >> "$LOG_FILE" 2>&1; then
-            log_message "Scheduled backup completed successfully (type: $backup_type)"
-            return 0
-        else
-            log_message "Scheduled backup failed (type: $backup_type)"
-            
-            # Send failure notification
-            if [ -f "/opt/coffeebreak/bin/notify.sh" ]; then
-                /opt/coffeebreak/bin/notify.sh "Scheduled Backup Failed" "Backup type: $backup_type failed to complete"
-            fi
-            return 1
-        fi
-    else
-        log_message "ERROR: Backup script not found: $BACKUP_SCRIPT"
-        return 1
-    fi
-}}
-
-# Function to check system load before backup
-check_system_load() {{
-    local max_load="{config.get('max_load_threshold', 2.0)}"
-    local current_load=$(uptime | awk -F'load average:' '{{ print $2 }}' | awk '{{ print $1 }}' | sed 's/,//')
-    
-    if (( $(echo "$current_load > $max_load" | bc -l) )); then
-        log_message "WARNING: System load too high ($current_load), delaying backup"
+        max_load = float(config.get('max_load_threshold', 2.0))
         
-        # Wait up to 30 minutes for load to decrease
-        local wait_count=0
-        while (( $(echo "$current_load > $max_load" | bc -l) )) && [ "$wait_count" -lt 30 ]; do
-            sleep 60
-            current_load=$(uptime | awk -F'load average:' '{{ print $2 }}' | awk '{{ print $1 }}' | sed 's/,//')
-            ((wait_count++))
-        done
+        scheduler_script = render_script('backup-scheduler.sh.in', {
+            'DOMAIN': domain,
+            'GENERATED': datetime.now().isoformat(),
+            'SCRIPTS_DIR': scripts_dir,
+            'MAX_LOAD': f"{max_load:.2f}",
+            'MAX_LOAD_X100': round(max_load * 100),
+            'BACKUP_DIR': config.get('backup_dir', '/opt/coffeebreak/backups'),
+            'MIN_FREE_SPACE_GB': int(config.get('min_free_space_gb', 5)),
+        })
         
-        if (( $(echo "$current_load > $max_load" | bc -l) )); then
-            log_message "ERROR: System load still too high after 30 minutes, skipping backup"
-            return 1
-        fi
-    fi
-    
-    return 0
-}}
-
-# Function to check disk space before backup
-check_disk_space() {{
-    local backup_dir="{config.get('backup_dir', '/opt/coffeebreak/backups')}"
-    local min_space_gb="{config.get('min_free_space_gb', 5)}"
-    
-    # Get available space in GB
-    local available_gb=$(df "$backup_dir" | tail -1 | awk '{{print int($4/1024/1024)}}')
-    
-    if [ "$available_gb" -lt "$min_space_gb" ]; then
-        log_message "ERROR: Insufficient disk space ($available_gb GB available, need $min_space_gb GB)"
-        
-        # Send low disk space alert
-        if [ -f "/opt/coffeebreak/bin/notify.sh" ]; then
-            /opt/coffeebreak/bin/notify.sh "Low Disk Space" "Only $available_gb GB available for backups (need $min_space_gb GB)"
-        fi
-        
-        return 1
-    fi
-    
-    return 0
-}}
-
-# Main scheduler function
-main() {{
-    local backup_type="${{1:-incremental}}"
-    
-    log_message "Backup scheduler started (type: $backup_type)"
-    
-    # Pre-backup checks
-    if ! check_system_load; then
-        exit 1
-    fi
-    
-    if ! check_disk_space; then
-        exit 1
-    fi
-    
-    # Lock file to prevent concurrent backups
-    local lock_file="/tmp/coffeebreak-backup.lock"
-    
-    if [ -f "$lock_file" ]; then
-        local lock_pid=$(cat "$lock_file" 2>/dev/null || echo "")
+        scheduler_script_path = f"{scripts_dir}/backup-scheduler.sh"
+        write_exec_script(scheduler_script_path, scheduler_script)
         
-        if [ -n "$lock_pid" ] && kill -0 "$lock_pid" 2>/dev/null; then
-            log_message "Backup already running (PID: $lock_pid), exiting"
-            exit 0
-        else
-            log_message "Stale lock file found, removing"
-            rm -f "$lock_file"
-        fi
-    fi
-    
-    # Create lock file
-    echo $$ > "$lock_file"
-    
-    # Ensure lock file is removed on exit
-    trap 'rm -f "$lock_file"' EXIT
+        return scheduler_script_path
     
-    # Run the backup
-    if run_backup "$backup_type"; then
-        log_message "Backup scheduler completed successfully"
-        exit 0
-    else
-        log_message "Backup scheduler completed with errors"
-        exit 1
-    fi
-}}
-
-# Handle command line arguments
-case "${{1:-incremental}}" in
-    "incremental"|"full")
-        main "$1"
-        ;;
-    *)
-        echo "Usage: $0 {{incremental|full}}"
-        exit 1
-        ;;
-esac
-"""
+    def _create_dispatch_script(self, domain: str, jobs: List[Tuple[str, str, str]],
+                                scripts_dir: str) -> str:
+        """Create the cron dispatcher script that runs whichever backup jobs are due."""
+        dispatch_script = render_script('cron-dispatch.sh.in', {
+            'DOMAIN': domain,
+            'GENERATED': datetime.now().isoformat(),
+            'SCRIPTS_DIR': scripts_dir,
+            'JOBS': "\n".join(f"    {shlex.quote(f'{schedule}|{command}')}"
+                               for _, schedule, command in jobs),
+        })
         
-        scheduler_script_path = f"{scripts_dir}/backup-scheduler.sh"
-        with open(scheduler_script_path, 'w') as f:
-            f.write(scheduler_script)
-        os.chmod(scheduler_script_path, 0o755)
+        dispatch_script_path = f"{scripts_dir}/coffeebreak-cron-dispatch.sh"
+        write_exec_script(dispatch_script_path, dispatch_script)
         
-        return scheduler_script_path
+        return dispatch_script_path
     
-    def _setup_cron_jobs(self, domain: str, config: Dict[str, Any], scripts_dir: str) -> Dict[str, Any]:
+    def _setup_cron_jobs(self, domain: str, config: Dict[str, Any], scripts_dir: str,
+                         cron: CronManager) -> Dict[str, Any]:
         """Setup cron jobs for backup scheduling."""
         setup_result = {
             'success': True,
@@ -238,54 +322,40 @@ esac
         
         try:
             # Default schedules
-            incremental_schedule = config.get('backup_schedule', '0 2 * * *')  # Daily at 2 AM
-            full_schedule = config.get('full_backup_schedule', '0 3 * * 0')  # Weekly on Sunday at 3 AM
+            incremental_schedule = config.get('backup_schedule', _DEFAULT_INCREMENTAL_SCHEDULE)
+            full_schedule = config.get('full_backup_schedule', _DEFAULT_FULL_SCHEDULE)
             
-            # Cron entries
-            cron_entries = [
-                f"# CoffeeBreak incremental backup",
-                f"{incremental_schedule} {scripts_dir}/backup-scheduler.sh incremental",
-                f"# CoffeeBreak full backup", 
-                f"{full_schedule} {scripts_dir}/backup-scheduler.sh full",
-                f"# CoffeeBreak backup verification",
-                f"0 4 * * * {scripts_dir}/verify-backup.sh",
-                f"# CoffeeBreak backup monitoring",
-                f"0 */6 * * * {scripts_dir}/monitor-backup.sh"
+            # Backup jobs: comment, schedule and command relative to scripts_dir
+            jobs = [
+                ("CoffeeBreak incremental backup", incremental_schedule, "backup-scheduler.sh incremental"),
+                ("CoffeeBreak full backup", full_schedule, "backup-scheduler.sh full"),
+                ("CoffeeBreak backup verification", "0 4 * * *", "verify-backup.sh"),
+                ("CoffeeBreak backup monitoring", "0 */6 * * *", "monitor-backup.sh"),
             ]
+            jobs = [(comment, ' '.join(schedule.split()), command) for comment, schedule, command in jobs]
+            dispatch_script_path = f"{scripts_dir}/coffeebreak-cron-dispatch.sh"
             
-            # Get current crontab
-            try:
-                current_crontab = subprocess.run(['crontab', '-l'], 
-                                               capture_output=True, text=True)
-                crontab_content = current_crontab.stdout if current_crontab.returncode == 0 else ""
-            except:
-                crontab_content = ""
-            
-            # Add new entries if they don't exist
-            new_entries = []
-            for entry in cron_entries:
-                if "backup-scheduler.sh" in entry or "verify-backup.sh" in entry or "monitor-backup.sh" in entry:
-                    if entry not in crontab_content:
-                        new_entries.append(entry)
-                        setup_result['jobs'].append(entry)
-                else:
-                    new_entries.append(entry)  # Comments
-            
-            if new_entries:
-                # Create new crontab
-                new_crontab = crontab_content.rstrip()
-                if new_crontab:
-                    new_crontab += "\\n"
-                new_crontab += "\\n".join(new_entries) + "\\n"
+            if all(_NUMERIC_SCHEDULE.match(schedule) for _, schedule, _ in jobs):
+                # A single entry starts the dispatcher, which runs the due jobs
+                self._create_dispatch_script(domain, jobs, scripts_dir)
+                dispatch_entry = f"{_dispatch_schedule([schedule for _, schedule, _ in jobs])} {dispatch_script_path}"
                 
-                # Install new crontab
-                process = subprocess.Popen(['crontab', '-'], 
-                                         stdin=subprocess.PIPE, text=True)
-                process.communicate(input=new_crontab)
+                # Replace per-job entries and any dispatcher entry with an older schedule
+                for script in _JOB_SCRIPTS:
+                    cron.remove(f"{scripts_dir}/{script}")
+                cron.remove(dispatch_script_path, keep=dispatch_entry)
                 
-                if process.returncode != 0:
-                    setup_result['success'] = False
-                    setup_result['errors'].append("Failed to install crontab")
+                cron_entries = [("CoffeeBreak backup jobs", dispatch_entry)]
+            else:
+                # Named schedules (@daily, mon, ...) are left to cron, one entry per job
+                cron.remove(dispatch_script_path)
+                cron_entries = [(comment, f"{schedule} {scripts_dir}/{command}")
+                                for comment, schedule, command in jobs]
+            
+            # Add new entries if they don't exist; the crontab is installed by the caller
+            for comment, entry in cron_entries:
+                if cron.add(entry, comment=comment):
+                    setup_result['jobs'].append(entry)
             
         except Exception as e:
             setup_result['success'] = False
@@ -301,6 +371,14 @@ esac
         }
         
         try:
+            # Timers fire on the same schedules as the cron jobs
+            incremental_calendar = "\n".join(
+                f"OnCalendar={calendar}" for calendar in
+                _cron_to_oncalendar(config.get('backup_schedule', _DEFAULT_INCREMENTAL_SCHEDULE)))
+            full_calendar = "\n".join(
+                f"OnCalendar={calendar}" for calendar in
+                _cron_to_oncalendar(config.get('full_backup_schedule', _DEFAULT_FULL_SCHEDULE)))
+            
             # Create systemd service files
             service_content = f"""[Unit]
 Description=CoffeeBreak Backup Service
@@ -314,47 +392,45 @@ StandardOutput=journal
 StandardError=journal
 """
             
-            with open('/etc/systemd/system/coffeebreak-backup@.service', 'w') as f:
-                f.write(service_content)
-            
             # Create timer for incremental backups
             incremental_timer = f"""[Unit]
 Description=CoffeeBreak Incremental Backup Timer
 Requires=coffeebreak-backup@incremental.service
 
 [Timer]
-OnCalendar={config.get('backup_schedule', 'daily')}
+{incremental_calendar}
 Persistent=true
 
 [Install]
 WantedBy=timers.target
 """
             
-            with open('/etc/systemd/system/coffeebreak-backup-incremental.timer', 'w') as f:
-                f.write(incremental_timer)
-            
             # Create timer for full backups
             full_timer = f"""[Unit]
 Description=CoffeeBreak Full Backup Timer
 Requires=coffeebreak-backup@full.service
 
 [Timer]
-OnCalendar={config.get('full_backup_schedule', 'weekly')}
+{full_calendar}
 Persistent=true
 
 [Install]
 WantedBy=timers.target
 """
             
-            with open('/etc/systemd/system/coffeebreak-backup-full.timer', 'w') as f:
-                f.write(full_timer)
+            # Install the units together, so a failed write never leaves
+            # systemd with a partial set on reload
+            atomic_write_all({
+                '/etc/systemd/system/coffeebreak-backup@.service': service_content.encode(),
+                '/etc/systemd/system/coffeebreak-backup-incremental.timer': incremental_timer.encode(),
+                '/etc/systemd/system/coffeebreak-backup-full.timer': full_timer.encode(),
+            })
             
-            # Reload systemd and enable timers
+            # Reload systemd, then enable and start both timers in one call
             subprocess.run(['systemctl', 'daemon-reload'], check=True)
-            subprocess.run(['systemctl', 'enable', 'coffeebreak-backup-incremental.timer'], check=True)
-            subprocess.run(['systemctl', 'enable', 'coffeebreak-backup-full.timer'], check=True)
-            subprocess.run(['systemctl', 'start', 'coffeebreak-backup-incremental.timer'], check=True)
-            subprocess.run(['systemctl', 'start', 'coffeebreak-backup-full.timer'], check=True)
+            subprocess.run(['systemctl', 'enable', '--now',
+                            'coffeebreak-backup-incremental.timer',
+                            'coffeebreak-backup-full.timer'], check=True)
             
         except Exception as e:
             setup_result['success'] = False
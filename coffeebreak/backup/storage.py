@@ -1,13 +1,119 @@
 """Backup storage management system."""
 
+import grp
+import hashlib
 import os
-import subprocess
+import pwd
+import re
 import shutil
-from pathlib import Path
-from typing import Dict, Any, Optional
+import subprocess
+import time
+from typing import Dict, Any, Optional, Tuple
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from ..utils.errors import ConfigurationError
+from .cron import CronManager
+from .files import atomic_write, load_template, render_script, write_exec_script, write_if_changed
+
+# Subdirectories of the backup directory, one per backup type
+_SUBDIRS = ('postgresql', 'mongodb', 'files', 'configs', 'logs')
+
+# Failures the storage setup steps report instead of raising; anything else
+# is a bug and reaches setup_backup_storage's catch-all
+_SETUP_ERRORS = (OSError, subprocess.SubprocessError, ConfigurationError)
+
+# Seconds a storage usage reading is reused for
+_STORAGE_INFO_TTL = 5.0
+
+# Script templates the storage setup renders
+_TEMPLATES = ('s3-sync.sh.in', 'rsync-sync.sh.in', 'sftp-sync.sh.in', 'storage-monitor.sh.in')
+
+# Octal escapes used in /proc/self/mountinfo paths
+_MOUNTINFO_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _service_account() -> Tuple[int, int]:
+    """
+    Return the uid of the coffeebreak user and gid of its group, creating them if needed.
+    
+    The account is looked up through NSS directly, so the common case of an
+    existing user forks no process.
+    
+    Raises:
+        ConfigurationError: If the user or group cannot be found or created
+    """
+    try:
+        account = pwd.getpwnam('coffeebreak')
+    except KeyError:
+        # User doesn't exist, create it
+        subprocess.run(['useradd', '--system', '--no-create-home', 
+                        '--shell', '/bin/false', 'coffeebreak'], 
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            account = pwd.getpwnam('coffeebreak')
+        except KeyError:
+            raise ConfigurationError("Failed to create the coffeebreak user") from None
+    
+    try:
+        return account.pw_uid, grp.getgrnam('coffeebreak').gr_gid
+    except KeyError:
+        raise ConfigurationError("The coffeebreak group does not exist") from None
+
+
+def _ensure_dir(path: str) -> None:
+    """Create path and its parents unless it already is a directory.
+    
+    Re-runs find the directory in place, so a stat replaces a mkdir that
+    would fail with EEXIST and raise inside makedirs.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+
+
+def _setup_key(deployment_type: str, config: Dict[str, Any]) -> str:
+    """Hash every input the storage layout, scripts and cron entries depend on."""
+    digest = hashlib.blake2b(digest_size=16)
+    # Docker deployments use paths relative to the working directory
+    for part in (deployment_type,
+                 json.dumps(config, sort_keys=True, default=str),
+                 os.getcwd(),
+                 *(load_template(name) for name in _TEMPLATES)):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _cached_result(stamp_path: str, key: str) -> Optional[Dict[str, Any]]:
+    """Return the setup result recorded with key in the stamp, if it matches."""
+    try:
+        with open(stamp_path) as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stamp.get('result') if stamp.get('key') == key else None
+
+
+def _mount_source(path: str) -> str:
+    """Return the device or source of the filesystem holding path, as df shows it."""
+    path = os.path.realpath(path)
+    source, mount_point = 'unknown', ''
+    
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                fields = line.split()
+                # Spaces and other specials in paths are octal escapes
+                candidate = _MOUNTINFO_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[4])
+                prefix = candidate.rstrip('/') + '/'
+                # The deepest (and, for stacked mounts, last) matching mount wins
+                if (path == candidate or path.startswith(prefix)) and len(candidate) >= len(mount_point):
+                    mount_point = candidate
+                    source = fields[fields.index('-') + 2]
+    except OSError:
+        pass
+    
+    return source
 
 
 class BackupStorage:
@@ -25,17 +131,39 @@ class BackupStorage:
         """
         self.deployment_type = deployment_type
         self.verbose = verbose
+        
+        # Locations depend only on the deployment type
+        if deployment_type == 'standalone':
+            self._scripts_dir = "/opt/coffeebreak/bin"
+            self._default_backup_dir = "/opt/coffeebreak/backups"
+        else:
+            self._scripts_dir = "./scripts"
+            self._default_backup_dir = "./backups"
+        
+        # Recent storage usage readings: absolute backup dir -> (monotonic time, info)
+        self._storage_info_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
     
-    def setup_backup_storage(self, config: Dict[str, Any]) -> Dict[str, Any]:
+    def setup_backup_storage(self, config: Dict[str, Any],
+                             cron: Optional[CronManager] = None) -> Dict[str, Any]:
         """
         Setup backup storage system.
         
         Args:
             config: Backup storage configuration
+            cron: Shared crontab editor; when omitted the crontab is
+                  read and installed by this call
             
         Returns:
             Dict[str, Any]: Setup results
         """
+        if cron is None:
+            try:
+                with CronManager(verbose=self.verbose) as own_cron:
+                    return self.setup_backup_storage(config, own_cron)
+            except ConfigurationError as e:
+                return {'success': False, 'errors': [str(e)], 'backup_path': None,
+                        'storage_type': 'local', 'storage_info': {}}
+        
         setup_result = {
             'success': True,
             'errors': [],
@@ -46,10 +174,22 @@ class BackupStorage:
         
         try:
             # Determine backup directory
-            if self.deployment_type == 'standalone':
-                backup_dir = config.get('backup_dir', '/opt/coffeebreak/backups')
-            else:
-                backup_dir = config.get('backup_dir', './backups')
+            backup_dir = config.get('backup_dir', self._default_backup_dir)
+            scripts_dir = self._scripts_dir
+            
+            # Repeated setups with unchanged inputs only refresh the disk usage.
+            # The stamp lives with the scripts, out of reach of the backup
+            # cleanup and the remote sync
+            stamp_path = os.path.join(scripts_dir, '.coffeebreak-storage.stamp')
+            key = _setup_key(self.deployment_type, config)
+            cached_result = _cached_result(stamp_path, key)
+            if cached_result is not None and self._outputs_current(backup_dir, scripts_dir, cached_result, cron):
+                cached_result['storage_info'].update(self._get_storage_info(backup_dir))
+                
+                if self.verbose:
+                    print("Backup storage up to date")
+                
+                return cached_result
             
             # Setup local storage
             local_setup = self._setup_local_storage(backup_dir, config)
@@ -59,9 +199,20 @@ class BackupStorage:
             else:
                 setup_result['errors'].extend(local_setup['errors'])
             
+            # Every generated script goes to scripts_dir
+            _ensure_dir(scripts_dir)
+            
+            # Remote storage and monitoring only share the (locked) cron editor,
+            # so they are set up concurrently once the local storage exists
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                remote_future = None
+                if config.get('remote_storage', False):
+                    remote_future = executor.submit(self._setup_remote_storage, backup_dir, scripts_dir, config, cron)
+                monitoring_future = executor.submit(self._setup_storage_monitoring, backup_dir, scripts_dir, config, cron)
+            
             # Setup remote storage if configured
-            if config.get('remote_storage', False):
-                remote_setup = self._setup_remote_storage(backup_dir, config)
+            if remote_future is not None:
+                remote_setup = remote_future.result()
                 if remote_setup['success']:
                     setup_result['storage_type'] = 'hybrid'
                     setup_result['storage_info'].update(remote_setup['info'])
@@ -69,12 +220,18 @@ class BackupStorage:
                     setup_result['errors'].extend(remote_setup['errors'])
             
             # Setup storage monitoring
-            monitoring_setup = self._setup_storage_monitoring(backup_dir, config)
+            monitoring_setup = monitoring_future.result()
             if not monitoring_setup['success']:
                 setup_result['errors'].extend(monitoring_setup['errors'])
             
             setup_result['success'] = len(setup_result['errors']) == 0
             
+            # The stamp is written last, so a partial setup is redone next time
+            if setup_result['success']:
+                atomic_write(stamp_path, json.dumps({'key': key, 'result': setup_result}).encode())
+                # The files just written count against the usage read earlier
+                self._storage_info_cache.pop(os.path.abspath(backup_dir), None)
+            
             if self.verbose:
                 print("Backup storage configured")
             
@@ -84,6 +241,22 @@ class BackupStorage:
         
         return setup_result
     
+    def _outputs_current(self, backup_dir: str, scripts_dir: str, result: Dict[str, Any],
+                         cron: CronManager) -> bool:
+        """Check whether the files and cron entries of a recorded setup are still in place."""
+        paths = [os.path.join(backup_dir, subdir) for subdir in _SUBDIRS]
+        paths.append(os.path.join(backup_dir, 'backup-config.json'))
+        paths.append(f"{scripts_dir}/storage-monitor.sh")
+        if 'sync_script' in result['storage_info']:
+            paths.append(result['storage_info']['sync_script'])
+        
+        cron_markers = ["storage-monitor.sh"]
+        if result['storage_info'].get('remote_type') == 's3':
+            cron_markers.append("s3-sync.sh")
+        
+        return (all(os.path.exists(path) for path in paths)
+                and all(cron.contains(marker) for marker in cron_markers))
+    
     def _setup_local_storage(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
         """Setup local backup storage."""
         setup_result = {
@@ -95,35 +268,26 @@ class BackupStorage:
         
         try:
             # Create backup directory structure
-            backup_path = Path(backup_dir)
-            backup_path.mkdir(parents=True, exist_ok=True)
+            _ensure_dir(backup_dir)
             
-            # Create subdirectories for different backup types
-            subdirs = ['postgresql', 'mongodb', 'files', 'configs', 'logs']
-            for subdir in subdirs:
-                (backup_path / subdir).mkdir(exist_ok=True)
+            # Create subdirectories for different backup types; one directory
+            # scan finds those left by an earlier setup
+            with os.scandir(backup_dir) as entries:
+                existing = {entry.name for entry in entries if entry.is_dir()}
+            for subdir in _SUBDIRS:
+                if subdir in existing:
+                    continue
+                os.makedirs(os.path.join(backup_dir, subdir), exist_ok=True)
             
             # Set appropriate permissions
             if self.deployment_type == 'standalone':
-                # Create coffeebreak user if it doesn't exist
-                try:
-                    subprocess.run(['id', 'coffeebreak'], 
-                                 capture_output=True, check=True)
-                except subprocess.CalledProcessError:
-                    # User doesn't exist, create it
-                    subprocess.run(['useradd', '--system', '--no-create-home', 
-                                  '--shell', '/bin/false', 'coffeebreak'], 
-                                 capture_output=True)
-                
-                # Set ownership and permissions
-                shutil.chown(backup_dir, user='coffeebreak', group='coffeebreak')
-                os.chmod(backup_dir, 0o750)
+                # Resolve (or create) the coffeebreak user once for every path below
+                uid, gid = _service_account()
                 
-                # Set permissions for subdirectories
-                for subdir in subdirs:
-                    subdir_path = backup_path / subdir
-                    shutil.chown(str(subdir_path), user='coffeebreak', group='coffeebreak')
-                    os.chmod(str(subdir_path), 0o750)
+                # Set ownership and permissions on the directory and its subdirectories
+                for path in [backup_dir] + [os.path.join(backup_dir, subdir) for subdir in _SUBDIRS]:
+                    os.chown(path, uid, gid)
+                    os.chmod(path, 0o750)
             
             # Get storage information
             storage_info = self._get_storage_info(backup_dir)
@@ -132,32 +296,34 @@ class BackupStorage:
             # Create backup configuration file
             backup_config = {
                 'backup_dir': backup_dir,
-                'created': str(Path().cwd()),
+                'created': os.getcwd(),
                 'deployment_type': self.deployment_type,
                 'retention_days': config.get('retention_days', 30),
                 'encryption_enabled': config.get('enable_encryption', True),
                 'compression_enabled': config.get('enable_compression', True)
             }
             
-            config_file = backup_path / 'backup-config.json'
-            with open(config_file, 'w') as f:
-                json.dump(backup_config, f, indent=2)
+            # Written in one piece with its final mode, and only when it changed;
+            # standalone deployments keep it readable by the coffeebreak group only
+            config_file = os.path.join(backup_dir, 'backup-config.json')
+            config_mode = 0o640 if self.deployment_type == 'standalone' else 0o644
+            write_if_changed(config_file, json.dumps(backup_config, separators=(',', ':')).encode(), config_mode)
             
             if self.deployment_type == 'standalone':
-                shutil.chown(str(config_file), user='coffeebreak', group='coffeebreak')
-                os.chmod(str(config_file), 0o640)
+                os.chown(config_file, uid, gid)
             
             if self.verbose:
                 print(f"Local backup storage created: {backup_dir}")
                 print(f"Available space: {storage_info.get('available_gb', 'unknown')} GB")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"Local storage setup failed: {e}")
         
         return setup_result
     
-    def _setup_remote_storage(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _setup_remote_storage(self, backup_dir: str, scripts_dir: str, config: Dict[str, Any],
+                              cron: CronManager) -> Dict[str, Any]:
         """Setup remote backup storage."""
         setup_result = {
             'success': True,
@@ -169,25 +335,26 @@ class BackupStorage:
             remote_type = config.get('remote_storage_type', 's3')
             
             if remote_type == 's3':
-                s3_setup = self._setup_s3_storage(backup_dir, config)
+                s3_setup = self._setup_s3_storage(backup_dir, scripts_dir, config, cron)
                 setup_result.update(s3_setup)
             elif remote_type == 'rsync':
-                rsync_setup = self._setup_rsync_storage(backup_dir, config)
+                rsync_setup = self._setup_rsync_storage(backup_dir, scripts_dir, config)
                 setup_result.update(rsync_setup)
             elif remote_type == 'sftp':
-                sftp_setup = self._setup_sftp_storage(backup_dir, config)
+                sftp_setup = self._setup_sftp_storage(backup_dir, scripts_dir, config)
                 setup_result.update(sftp_setup)
             else:
                 setup_result['success'] = False
                 setup_result['errors'].append(f"Unsupported remote storage type: {remote_type}")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"Remote storage setup failed: {e}")
         
         return setup_result
     
-    def _setup_s3_storage(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _setup_s3_storage(self, backup_dir: str, scripts_dir: str, config: Dict[str, Any],
+                          cron: CronManager) -> Dict[str, Any]:
         """Setup S3-compatible storage."""
         setup_result = {
             'success': True,
@@ -197,15 +364,14 @@ class BackupStorage:
         
         try:
             # Check if AWS CLI is available
-            result = subprocess.run(['which', 'aws'], capture_output=True)
-            if result.returncode != 0:
+            if shutil.which('aws') is None:
                 # Try to install AWS CLI
                 try:
-                    if subprocess.run(['which', 'pip3'], capture_output=True).returncode == 0:
+                    if shutil.which('pip3') is not None:
                         subprocess.run(['pip3', 'install', 'awscli'], check=True)
                     else:
-                        raise Exception("AWS CLI not available and pip3 not found")
-                except Exception as e:
+                        raise ConfigurationError("AWS CLI not available and pip3 not found")
+                except _SETUP_ERRORS as e:
                     setup_result['errors'].append(f"Failed to install AWS CLI: {e}")
                     return setup_result
             
@@ -218,101 +384,20 @@ class BackupStorage:
                 setup_result['errors'].append("S3 bucket not specified in configuration")
                 return setup_result
             
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
-            s3_sync_script = f"""#!/bin/bash
-# CoffeeBreak S3 Backup Sync Script
-
-set -euo pipefail
-
-BACKUP_DIR="{backup_dir}"
-S3_BUCKET="{s3_bucket}"
-S3_PREFIX="{s3_prefix}"
-LOG_FILE="/var/log/coffeebreak/s3-sync.log"
-
-# Function to log with timestamp
-log_message() {{
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
-
-# Function to sync to S3
-sync_to_s3() {{
-    log_message "Starting S3 sync"
-    
-    # Sync backup directory to S3
-    if aws s3 sync "$BACKUP_DIR" "s3://$S3_BUCKET/$S3_PREFIX" --region {s3_region} --delete; then
-        log_message "S3 sync completed successfully"
-        return 0
-    else
-        log_message "S3 sync failed"
-        return 1
-    fi
-}}
-
-# Function to verify S3 sync
-verify_s3_sync() {{
-    log_message "Verifying S3 sync"
-    
-    local local_files=$(find "$BACKUP_DIR" -type f | wc -l)
-    local s3_files=$(aws s3 ls "s3://$S3_BUCKET/$S3_PREFIX" --recursive | wc -l)
-    
-    log_message "Local files: $local_files, S3 files: $s3_files"
-    
-    if [ "$s3_files" -gt 0 ]; then
-        log_message "S3 sync verification passed"
-        return 0
-    else
-        log_message "S3 sync verification failed"
-        return 1
-    fi
-}}
-
-# Main function
-main() {{
-    local action="${{1:-sync}}"
-    
-    case "$action" in
-        "sync")
-            sync_to_s3
-            ;;
-        "verify")
-            verify_s3_sync
-            ;;
-        *)
-            echo "Usage: $0 {{sync|verify}}"
-            exit 1
-            ;;
-    esac
-}}
-
-main "$@"
-"""
+            s3_sync_script = render_script('s3-sync.sh.in', {
+                'BACKUP_DIR': backup_dir,
+                'S3_BUCKET': s3_bucket,
+                'S3_PREFIX': s3_prefix,
+                'S3_REGION': s3_region,
+            })
             
             s3_script_path = f"{scripts_dir}/s3-sync.sh"
-            os.makedirs(scripts_dir, exist_ok=True)
-            
-            with open(s3_script_path, 'w') as f:
-                f.write(s3_sync_script)
-            os.chmod(s3_script_path, 0o755)
+            write_exec_script(s3_script_path, s3_sync_script)
             
-            # Setup S3 sync cron job
-            cron_entry = f"0 */6 * * * {s3_script_path} sync"
-            
-            try:
-                current_crontab = subprocess.run(['crontab', '-l'], 
-                                               capture_output=True, text=True)
-                crontab_content = current_crontab.stdout if current_crontab.returncode == 0 else ""
-            except:
-                crontab_content = ""
-            
-            if "s3-sync.sh" not in crontab_content:
-                new_crontab = crontab_content.rstrip() + "\\n" + cron_entry + "\\n"
-                process = subprocess.Popen(['crontab', '-'], 
-                                         stdin=subprocess.PIPE, text=True)
-                process.communicate(input=new_crontab)
+            # Setup S3 sync cron job; the crontab is installed by the caller
+            if not cron.contains("s3-sync.sh"):
+                cron.add(f"0 */6 * * * {s3_script_path} sync",
+                         comment="CoffeeBreak S3 backup sync")
             
             setup_result['info'].update({
                 'bucket': s3_bucket,
@@ -324,13 +409,13 @@ main "$@"
             if self.verbose:
                 print(f"S3 storage configured: s3://{s3_bucket}/{s3_prefix}")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"S3 storage setup failed: {e}")
         
         return setup_result
     
-    def _setup_rsync_storage(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _setup_rsync_storage(self, backup_dir: str, scripts_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
         """Setup rsync-based remote storage."""
         setup_result = {
             'success': True,
@@ -347,82 +432,15 @@ main "$@"
                 setup_result['errors'].append("Rsync host and path must be specified")
                 return setup_result
             
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
-            rsync_script = f"""#!/bin/bash
-# CoffeeBreak Rsync Backup Sync Script
-
-set -euo pipefail
-
-BACKUP_DIR="{backup_dir}"
-RSYNC_HOST="{rsync_host}"
-RSYNC_PATH="{rsync_path}"
-RSYNC_USER="{rsync_user}"
-LOG_FILE="/var/log/coffeebreak/rsync-sync.log"
-
-# Function to log with timestamp
-log_message() {{
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
-
-# Function to sync via rsync
-sync_via_rsync() {{
-    log_message "Starting rsync sync"
-    
-    # Sync backup directory via rsync
-    if rsync -avz --delete "$BACKUP_DIR/" "$RSYNC_USER@$RSYNC_HOST:$RSYNC_PATH/"; then
-        log_message "Rsync sync completed successfully"
-        return 0
-    else
-        log_message "Rsync sync failed"
-        return 1
-    fi
-}}
-
-# Function to verify rsync sync
-verify_rsync_sync() {{
-    log_message "Verifying rsync sync"
-    
-    # Check if remote directory exists and has files
-    if ssh "$RSYNC_USER@$RSYNC_HOST" "test -d $RSYNC_PATH && find $RSYNC_PATH -type f | head -1"; then
-        log_message "Rsync sync verification passed"
-        return 0
-    else
-        log_message "Rsync sync verification failed"
-        return 1
-    fi
-}}
-
-# Main function
-main() {{
-    local action="${{1:-sync}}"
-    
-    case "$action" in
-        "sync")
-            sync_via_rsync
-            ;;
-        "verify")
-            verify_rsync_sync
-            ;;
-        *)
-            echo "Usage: $0 {{sync|verify}}"
-            exit 1
-            ;;
-    esac
-}}
-
-main "$@"
-"""
+            rsync_script = render_script('rsync-sync.sh.in', {
+                'BACKUP_DIR': backup_dir,
+                'RSYNC_HOST': rsync_host,
+                'RSYNC_PATH': rsync_path,
+                'RSYNC_USER': rsync_user,
+            })
             
             rsync_script_path = f"{scripts_dir}/rsync-sync.sh"
-            os.makedirs(scripts_dir, exist_ok=True)
-            
-            with open(rsync_script_path, 'w') as f:
-                f.write(rsync_script)
-            os.chmod(rsync_script_path, 0o755)
+            write_exec_script(rsync_script_path, rsync_script)
             
             setup_result['info'].update({
                 'host': rsync_host,
@@ -434,13 +452,13 @@ main "$@"
             if self.verbose:
                 print(f"Rsync storage configured: {rsync_user}@{rsync_host}:{rsync_path}")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"Rsync storage setup failed: {e}")
         
         return setup_result
     
-    def _setup_sftp_storage(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _setup_sftp_storage(self, backup_dir: str, scripts_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
         """Setup SFTP-based remote storage."""
         setup_result = {
             'success': True,
@@ -457,93 +475,15 @@ main "$@"
                 setup_result['errors'].append("SFTP host and path must be specified")
                 return setup_result
             
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
-            sftp_script = f"""#!/bin/bash
-# CoffeeBreak SFTP Backup Sync Script
-
-set -euo pipefail
-
-BACKUP_DIR="{backup_dir}"
-SFTP_HOST="{sftp_host}"
-SFTP_PATH="{sftp_path}"
-SFTP_USER="{sftp_user}"
-LOG_FILE="/var/log/coffeebreak/sftp-sync.log"
-
-# Function to log with timestamp
-log_message() {{
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
-
-# Function to sync via SFTP
-sync_via_sftp() {{
-    log_message "Starting SFTP sync"
-    
-    # Create SFTP batch file
-    local batch_file="/tmp/sftp-batch-$(date +%s)"
-    
-    cat > "$batch_file" << EOF
-mkdir $SFTP_PATH
-put -r $BACKUP_DIR/* $SFTP_PATH/
-quit
-EOF
-    
-    # Execute SFTP batch
-    if sftp -b "$batch_file" "$SFTP_USER@$SFTP_HOST"; then
-        log_message "SFTP sync completed successfully"
-        rm -f "$batch_file"
-        return 0
-    else
-        log_message "SFTP sync failed"
-        rm -f "$batch_file"
-        return 1
-    fi
-}}
-
-# Function to verify SFTP sync
-verify_sftp_sync() {{
-    log_message "Verifying SFTP sync"
-    
-    # Check if remote directory exists
-    if sftp "$SFTP_USER@$SFTP_HOST" <<< "ls $SFTP_PATH" | grep -q "."; then
-        log_message "SFTP sync verification passed"
-        return 0
-    else
-        log_message "SFTP sync verification failed"
-        return 1
-    fi
-}}
-
-# Main function
-main() {{
-    local action="${{1:-sync}}"
-    
-    case "$action" in
-        "sync")
-            sync_via_sftp
-            ;;
-        "verify")
-            verify_sftp_sync
-            ;;
-        *)
-            echo "Usage: $0 {{sync|verify}}"
-            exit 1
-            ;;
-    esac
-}}
-
-main "$@"
-"""
+            sftp_script = render_script('sftp-sync.sh.in', {
+                'BACKUP_DIR': backup_dir,
+                'SFTP_HOST': sftp_host,
+                'SFTP_PATH': sftp_path,
+                'SFTP_USER': sftp_user,
+            })
             
             sftp_script_path = f"{scripts_dir}/sftp-sync.sh"
-            os.makedirs(scripts_dir, exist_ok=True)
-            
-            with open(sftp_script_path, 'w') as f:
-                f.write(sftp_script)
-            os.chmod(sftp_script_path, 0o755)
+            write_exec_script(sftp_script_path, sftp_script)
             
             setup_result['info'].update({
                 'host': sftp_host,
@@ -555,13 +495,14 @@ main "$@"
             if self.verbose:
                 print(f"SFTP storage configured: {sftp_user}@{sftp_host}:{sftp_path}")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"SFTP storage setup failed: {e}")
         
         return setup_result
     
-    def _setup_storage_monitoring(self, backup_dir: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    def _setup_storage_monitoring(self, backup_dir: str, scripts_dir: str, config: Dict[str, Any],
+                                  cron: CronManager) -> Dict[str, Any]:
         """Setup storage monitoring and alerts."""
         setup_result = {
             'success': True,
@@ -569,201 +510,63 @@ main "$@"
         }
         
         try:
-            if self.deployment_type == 'standalone':
-                scripts_dir = "/opt/coffeebreak/bin"
-            else:
-                scripts_dir = "./scripts"
-            
             # Storage monitoring script
-            monitoring_script = f"""#!/bin/bash
-# CoffeeBreak Storage Monitoring Script
-
-BACKUP_DIR="{backup_dir}"
-LOG_FILE="/var/log/coffeebreak/storage-monitor.log"
-ALERT_EMAIL="{config.get('alert_email', 'admin@localhost')}"
-WARNING_THRESHOLD={config.get('storage_warning_percent', 80)}
-CRITICAL_THRESHOLD={config.get('storage_critical_percent', 90)}
-
-# Function to log with timestamp
-log_message() {{
-    echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" | tee -a "$LOG_FILE"
-}}
-
-# Function to send alert
-send_alert() {{
-    local subject="$1"
-    local message="$2"
-    
-    log_message "ALERT: $subject"
-    
-    if command -v mail &> /dev/null && [ -n "$ALERT_EMAIL" ]; then
-        echo "$message" | mail -s "CoffeeBreak Storage Alert: $subject" "$ALERT_EMAIL"
-    fi
-    
-    if [ -f "/opt/coffeebreak/bin/notify.sh" ]; then
-        /opt/coffeebreak/bin/notify.sh "$subject" "$message"
-    fi
-    
-    logger -t coffeebreak-storage "ALERT: $subject - $message"
-}}
-
-# Function to check disk usage
-check_disk_usage() {{
-    log_message "Checking backup storage disk usage"
-    
-    local usage_info=$(df "$BACKUP_DIR" | tail -1)
-    local usage_percent=$(echo "$usage_info" | awk '{{print $5}}' | sed 's/%//')
-    local available_gb=$(echo "$usage_info" | awk '{{print int($4/1024/1024)}}')
-    
-    log_message "Storage usage: $usage_percent% ($available_gb GB available)"
-    
-    if [ "$usage_percent" -ge "$CRITICAL_THRESHOLD" ]; then
-        send_alert "Critical Storage Usage" "Backup storage is $usage_percent% full ($available_gb GB available). Immediate action required!"
-    elif [ "$usage_percent" -ge "$WARNING_THRESHOLD" ]; then
-        send_alert "High Storage Usage" "Backup storage is $usage_percent% full ($available_gb GB available). Consider cleanup."
-    fi
-}}
-
-# Function to check backup directory health
-check_backup_health() {{
-    log_message "Checking backup directory health"
-    
-    if [ ! -d "$BACKUP_DIR" ]; then
-        send_alert "Backup Directory Missing" "Backup directory $BACKUP_DIR does not exist"
-        return 1
-    fi
-    
-    if [ ! -w "$BACKUP_DIR" ]; then
-        send_alert "Backup Directory Not Writable" "Cannot write to backup directory $BACKUP_DIR"
-        return 1
-    fi
-    
-    # Check subdirectories
-    local subdirs=("postgresql" "mongodb" "files" "configs")
-    for subdir in "${{subdirs[@]}}"; do
-        if [ ! -d "$BACKUP_DIR/$subdir" ]; then
-            send_alert "Backup Subdirectory Missing" "Backup subdirectory $BACKUP_DIR/$subdir is missing"
-        fi
-    done
-}}
-
-# Function to check storage performance
-check_storage_performance() {{
-    log_message "Checking storage performance"
-    
-    local test_file="$BACKUP_DIR/.storage-test-$(date +%s)"
-    local start_time=$(date +%s.%N)
-    
-    # Write test (10MB)
-    if dd if=/dev/zero of="$test_file" bs=1M count=10 &>/dev/null; then
-        local end_time=$(date +%s.%N)
-        local write_time=$(echo "$end_time - $start_time" | bc)
-        local write_speed=$(echo "scale=2; 10 / $write_time" | bc)
-        
-        log_message "Storage write speed: ${{write_speed}} MB/s"
-        
-        # Cleanup test file
-        rm -f "$test_file"
-        
-        # Alert if write speed is too slow (less than 1 MB/s)
-        if (( $(echo "$write_speed < 1" | bc -l) )); then
-            send_alert "Slow Storage Performance" "Storage write speed is only ${{write_speed}} MB/s"
-        fi
-    else
-        send_alert "Storage Write Test Failed" "Cannot write test file to $BACKUP_DIR"
-    fi
-}}
-
-# Function to monitor remote storage sync
-check_remote_sync() {{
-    local sync_script_patterns=("s3-sync.sh" "rsync-sync.sh" "sftp-sync.sh")
-    
-    for pattern in "${{sync_script_patterns[@]}}"; do
-        local sync_script=$(find /opt/coffeebreak/bin -name "$pattern" 2>/dev/null | head -1)
-        
-        if [ -f "$sync_script" ]; then
-            log_message "Checking remote sync: $pattern"
-            
-            if "$sync_script" verify; then
-                log_message "✓ Remote sync verification passed: $pattern"
-            else
-                send_alert "Remote Sync Failed" "Remote sync verification failed for $pattern"
-            fi
-        fi
-    done
-}}
-
-# Main monitoring function
-main() {{
-    log_message "Starting storage monitoring check"
-    
-    check_disk_usage
-    check_backup_health
-    check_storage_performance
-    check_remote_sync
-    
-    log_message "Storage monitoring check completed"
-}}
-
-main "$@"
-"""
+            monitoring_script = render_script('storage-monitor.sh.in', {
+                'BACKUP_DIR': backup_dir,
+                'ALERT_EMAIL': config.get('alert_email', 'admin@localhost'),
+                'WARNING_THRESHOLD': config.get('storage_warning_percent', 80),
+                'CRITICAL_THRESHOLD': config.get('storage_critical_percent', 90),
+            })
             
             monitoring_script_path = f"{scripts_dir}/storage-monitor.sh"
-            os.makedirs(scripts_dir, exist_ok=True)
-            
-            with open(monitoring_script_path, 'w') as f:
-                f.write(monitoring_script)
-            os.chmod(monitoring_script_path, 0o755)
+            write_exec_script(monitoring_script_path, monitoring_script)
             
-            # Setup cron job for storage monitoring
-            cron_entry = f"0 */4 * * * {monitoring_script_path}"
-            
-            try:
-                current_crontab = subprocess.run(['crontab', '-l'], 
-                                               capture_output=True, text=True)
-                crontab_content = current_crontab.stdout if current_crontab.returncode == 0 else ""
-            except:
-                crontab_content = ""
-            
-            if "storage-monitor.sh" not in crontab_content:
-                new_crontab = crontab_content.rstrip() + "\\n" + cron_entry + "\\n"
-                process = subprocess.Popen(['crontab', '-'], 
-                                         stdin=subprocess.PIPE, text=True)
-                process.communicate(input=new_crontab)
+            # Setup cron job for storage monitoring; the crontab is installed by the caller
+            if not cron.contains("storage-monitor.sh"):
+                cron.add(f"0 */4 * * * {monitoring_script_path}",
+                         comment="CoffeeBreak storage monitoring")
             
             if self.verbose:
                 print("Storage monitoring configured")
             
-        except Exception as e:
+        except _SETUP_ERRORS as e:
             setup_result['success'] = False
             setup_result['errors'].append(f"Storage monitoring setup failed: {e}")
         
         return setup_result
     
     def _get_storage_info(self, backup_dir: str) -> Dict[str, Any]:
-        """Get storage information for backup directory."""
+        """Get storage information for backup directory, reusing a reading from the last few seconds."""
+        cache_key = os.path.abspath(backup_dir)
+        cached = self._storage_info_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < _STORAGE_INFO_TTL:
+            return dict(cached[1])
+        
         try:
-            # Get disk usage information
-            result = subprocess.run(['df', backup_dir], 
-                                  capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\\n')
-                if len(lines) >= 2:
-                    fields = lines[1].split()
-                    
-                    return {
-                        'filesystem': fields[0],
-                        'total_kb': int(fields[1]),
-                        'used_kb': int(fields[2]),
-                        'available_kb': int(fields[3]),
-                        'total_gb': round(int(fields[1]) / 1024 / 1024, 2),
-                        'used_gb': round(int(fields[2]) / 1024 / 1024, 2),
-                        'available_gb': round(int(fields[3]) / 1024 / 1024, 2),
-                        'usage_percent': fields[4]
-                    }
-            
-            return {'error': 'Could not get storage information'}
+            # Disk usage straight from statfs, in the 1K blocks df reports
+            stats = os.statvfs(backup_dir)
+            total_kb = stats.f_blocks * stats.f_frsize // 1024
+            used_kb = (stats.f_blocks - stats.f_bfree) * stats.f_frsize // 1024
+            available_kb = stats.f_bavail * stats.f_frsize // 1024
+            
+            # Like df, usage is relative to the space available to unprivileged
+            # users and rounded up
+            usable_kb = used_kb + available_kb
+            usage_percent = -(-used_kb * 100 // usable_kb) if usable_kb else 0
+            
+            storage_info = {
+                'filesystem': _mount_source(backup_dir),
+                'total_kb': total_kb,
+                'used_kb': used_kb,
+                'available_kb': available_kb,
+                'total_gb': round(total_kb / 1024 / 1024, 2),
+                'used_gb': round(used_kb / 1024 / 1024, 2),
+                'available_gb': round(available_kb / 1024 / 1024, 2),
+                'usage_percent': f"{usage_percent}%"
+            }
             
-        except Exception as e:
-            return {'error': f'Failed to get storage info: {e}'}
\ No newline at end of file
+        except OSError as e:
+            return {'error': f'Failed to get storage info: {e}'}
+        
+        self._storage_info_cache[cache_key] = (time.monotonic(), storage_info)
+        return dict(storage_info)
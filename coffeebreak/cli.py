@@ -4,8 +4,6 @@ import os
 import click
 from pathlib import Path
 from coffeebreak import __version__
-from coffeebreak.utils.logging import setup_logging
-from coffeebreak.utils.errors import ErrorHandler
 
 
 @click.group(context_settings={'help_option_names': ['-h', '--help']})
@@ -16,6 +14,11 @@ from coffeebreak.utils.errors import ErrorHandler
 @click.pass_context
 def cli(ctx, verbose, dry_run, log_file):
     """CoffeeBreak CLI - Development and deployment automation tool."""
+    # Imported here rather than at module level: coffeebreak.utils pulls in
+    # jinja2 and certifi, which --help, --version and completion never need
+    from coffeebreak.utils.errors import ErrorHandler
+    from coffeebreak.utils.logging import setup_logging
+    
     ctx.ensure_object(dict)
     ctx.obj['verbose'] = verbose
     ctx.obj['dry_run'] = dry_run
@@ -99,7 +102,8 @@ def dev(ctx, organization, version, venv, conda, python):
 
 
 @cli.command()
-@click.option('--shell', help='Target shell (bash, zsh, fish, cmd, powershell)')
+@click.option('--shell', type=click.Choice(['bash', 'zsh', 'fish', 'cmd', 'powershell'], case_sensitive=False),
+              help='Target shell')
 @click.option('--info', is_flag=True, help='Show environment information only')
 @click.option('--show-command', is_flag=True, help='Show activation command instead of auto-executing')
 @click.pass_context
@@ -119,24 +123,26 @@ def activate(ctx, shell, info, show_command):
         if info:
             # Show environment information
             env_info = activator.get_environment_info()
-            click.echo(f"Environment Type: {env_info['type']}")
+            lines = [f"Environment Type: {env_info['type']}"]
             if env_info['type'] == 'venv':
-                click.echo(f"Environment Path: {env_info['path']}")
+                lines.append(f"Environment Path: {env_info['path']}")
             elif env_info['type'] == 'conda':
-                click.echo(f"Environment Name: {env_info['name']}")
+                lines.append(f"Environment Name: {env_info['name']}")
             if 'python_path' in env_info and env_info['python_path']:
-                click.echo(f"Python Path: {env_info['python_path']}")
+                lines.append(f"Python Path: {env_info['python_path']}")
+            click.echo("\n".join(lines))
             return
         
         if show_command:
             # Old behavior: show activation command
-            activation_cmd = activator.get_activation_command(shell)
+            # Detect the shell once for both the command and the hint below
+            target_shell = shell or activator._detect_shell()
+            activation_cmd = activator.get_activation_command(target_shell)
             click.echo("To activate your CoffeeBreak environment, run:")
             click.echo(f"  {activation_cmd}")
             
             if not shell:
-                detected_shell = activator._detect_shell()
-                click.echo(f"\nDetected shell: {detected_shell}")
+                click.echo(f"\nDetected shell: {target_shell}")
                 click.echo("Use --shell to specify a different shell")
             return
         
@@ -147,21 +153,22 @@ def activate(ctx, shell, info, show_command):
         click.echo(f"Starting new {detected_shell} shell with CoffeeBreak environment activated...")
         click.echo("Type 'exit' to return to your original shell.")
         
-        # Set up environment variables
-        new_env = os.environ.copy()
+        # Set up environment variables; None lets the shell inherit ours unchanged
+        new_env = None
         
         if env_info['type'] == 'venv':
             venv_path = env_info['path']
-            new_env['VIRTUAL_ENV'] = venv_path
-            new_env['PATH'] = f"{os.path.join(venv_path, 'bin')}:{new_env.get('PATH', '')}"
+            bin_dir = os.path.join(venv_path, 'Scripts' if os.name == 'nt' else 'bin')
+            # Put the venv first on PATH and show activation in the prompt
+            new_env = {
+                **os.environ,
+                'VIRTUAL_ENV': venv_path,
+                'PATH': os.pathsep.join((bin_dir, os.environ.get('PATH', ''))),
+                'PS1': f"(coffeebreak) {os.environ.get('PS1', '$ ')}",
+            }
             
             # Remove PYTHONHOME if present (can interfere with venv)
-            if 'PYTHONHOME' in new_env:
-                del new_env['PYTHONHOME']
-            
-            # Update PS1 prompt to show activation
-            ps1 = new_env.get('PS1', '$ ')
-            new_env['PS1'] = f"(coffeebreak) {ps1}"
+            new_env.pop('PYTHONHOME', None)
             
         elif env_info['type'] == 'conda':
             # For conda environments, we need to use conda's activation
@@ -227,21 +234,32 @@ def production(ctx, docker, domain, ssl_email, standalone, output_dir):
         click.echo(f"DRY RUN: Output: {output_dir}")
         return
     
+    import sys
+    
+    # Without a terminal there is nobody to answer the prompts below
+    interactive = sys.stdin.isatty()
+    if not domain and not interactive:
+        raise click.UsageError("--domain is required when not running interactively")
+    
     try:
-        from coffeebreak.config import ConfigManager
-        from coffeebreak.environments.production import ProductionEnvironment
-        
-        # Initialize components
-        config_manager = ConfigManager()
-        prod_env = ProductionEnvironment(config_manager, verbose=ctx.obj['verbose'])
-        
         click.echo("Initializing CoffeeBreak production environment...")
         
+        # Ask for missing settings before loading the production environment
         if not domain:
             domain = click.prompt("Production domain (e.g., your-domain.com)")
         
         if not ssl_email:
-            ssl_email = click.prompt(f"Email for SSL certificates", default=f"admin@{domain}")
+            if interactive:
+                ssl_email = click.prompt(f"Email for SSL certificates", default=f"admin@{domain}")
+            else:
+                ssl_email = f"admin@{domain}"
+        
+        from coffeebreak.config import ConfigManager
+        from coffeebreak.environments.production import ProductionEnvironment
+        
+        # Initialize components
+        config_manager = ConfigManager()
+        prod_env = ProductionEnvironment(config_manager, verbose=ctx.obj['verbose'])
         
         if standalone:
             # Standalone installation
@@ -418,10 +436,22 @@ def status(ctx):
         return
     
     try:
-        from coffeebreak.environments.automation import DevEnvironmentAutomation
-        
-        automation = DevEnvironmentAutomation(verbose=ctx.obj['verbose'])
-        env_status = automation.get_environment_status()
+        from coffeebreak.environments.detector import EnvironmentDetector, EnvironmentType
+        
+        if EnvironmentDetector().detect_environment() == EnvironmentType.UNINITIALIZED:
+            # Nothing to query without a configuration; skip loading the automation and Docker layers
+            env_status = {
+                'environment_type': EnvironmentType.UNINITIALIZED.value,
+                'is_running': False,
+                'services': {},
+                'repositories': {},
+                'errors': ["No configuration found"],
+            }
+        else:
+            from coffeebreak.environments.automation import DevEnvironmentAutomation
+            
+            automation = DevEnvironmentAutomation(verbose=ctx.obj['verbose'])
+            env_status = automation.get_environment_status()
         
         click.echo(f"Environment Type: {env_status['environment_type']}")
         click.echo(f"Running: {'Yes' if env_status['is_running'] else 'No'}")
@@ -532,16 +562,15 @@ def logs(ctx, service, tail, follow, since):
             else:
                 # Regular mode - show last N lines
                 try:
+                    from collections import deque
+                    
+                    # Keep only the last N lines while reading
                     with open(log_path, 'r') as f:
-                        lines = f.readlines()
-                        
-                    # Apply tail limit
-                    if tail and len(lines) > tail:
-                        lines = lines[-tail:]
+                        lines = deque(f, maxlen=tail or None)
                     
-                    # Print lines
-                    for line in lines:
-                        click.echo(line.rstrip())
+                    # Print lines in a single write
+                    if lines:
+                        click.echo("\n".join(line.rstrip() for line in lines))
                         
                 except Exception as e:
                     click.echo(f"Error reading log file: {e}")
@@ -1439,27 +1468,33 @@ def logs(ctx, service, follow, tail, since):
                 click.echo("No dependency containers are running")
                 return
             
-            for container in running_containers:
-                service_name = container['name']
-                click.echo(f"\n=== Logs for {service_name} ===")
-                
-                logs_result = dependency_manager.get_service_logs(
+            from concurrent.futures import ThreadPoolExecutor
+            
+            service_names = [container['name'] for container in running_containers]
+            
+            def fetch_logs(service_name):
+                return dependency_manager.get_service_logs(
                     service_name=service_name,
                     follow=False,
                     tail=min(tail // len(running_containers), 20),  # Distribute lines among services
                     since=since
                 )
-                
-                if logs_result['success']:
-                    logs_content = logs_result['logs'].strip()
-                    if logs_content:
-                        click.echo(logs_content)
+            
+            # Fetch every service's logs concurrently, printing them in order as they arrive
+            with ThreadPoolExecutor(max_workers=min(32, len(service_names))) as executor:
+                for service_name, logs_result in zip(service_names, executor.map(fetch_logs, service_names)):
+                    click.echo(f"\n=== Logs for {service_name} ===")
+                    
+                    if logs_result['success']:
+                        logs_content = logs_result['logs'].strip()
+                        if logs_content:
+                            click.echo(logs_content)
+                        else:
+                            click.echo("No recent logs")
                     else:
-                        click.echo("No recent logs")
-                else:
-                    click.echo(f"Failed to get logs: {logs_result.get('error', 'Unknown error')}")
-                
-                click.echo("")  # Add spacing between services
+                        click.echo(f"Failed to get logs: {logs_result.get('error', 'Unknown error')}")
+                    
+                    click.echo("")  # Add spacing between services
         
     except Exception as e:
         ctx.obj['error_handler'].exit_with_error(e, "Log retrieval")
@@ -2124,7 +2159,7 @@ def rotate(ctx, service, secret_type, force, backup):
         # Process results
         if results:
             successful = sum(1 for r in results if r['success'])
-            failed = sum(1 for r in results if not r['success'])
+            failed = len(results) - successful
             
             click.echo(f"\nRotation completed:")
             click.echo(f"  ✓ Successful: {successful}")
@@ -3227,7 +3262,7 @@ def rotate_secrets(ctx, rotation_config, max_rotations, force):
             click.echo(f"\nRotation completed: {len(results)} secrets processed")
             
             successful = sum(1 for r in results if r['success'])
-            failed = sum(1 for r in results if not r['success'])
+            failed = len(results) - successful
             
             click.echo(f"Successful: {successful}")
             click.echo(f"Failed: {failed}")
@@ -7,6 +7,9 @@ from jinja2 import Environment, FileSystemLoader, Template
 from .validator import ConfigValidator, ConfigValidationError
 from ..environments.detector import EnvironmentDetector, EnvironmentType
 
+# libyaml's parser, about ten times faster than the pure-Python one, when PyYAML was built with it
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class ConfigManager:
     """Manages CoffeeBreak configuration files."""
@@ -65,7 +68,7 @@ class ConfigManager:
         # Load configuration
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_SafeLoader)
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file not found: {config_path}")
         except yaml.YAMLError as e:
@@ -104,7 +107,7 @@ class ConfigManager:
         
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f) or {}
+                config = yaml.load(f, Loader=_SafeLoader) or {}
             
             if validate:
                 # Determine config type by filename
@@ -5,6 +5,9 @@ import yaml
 from typing import List, Dict, Any, Optional
 from .schemas import MAIN_CONFIG_SCHEMA, PLUGIN_CONFIG_SCHEMA
 
+# Use libyaml's parser when PyYAML was built with it
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class ConfigValidationError(Exception):
     """Raised when configuration validation fails."""
@@ -114,7 +117,7 @@ class ConfigValidator:
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_SafeLoader)
         except FileNotFoundError:
             return [f"Configuration file not found: {file_path}"]
         except yaml.YAMLError as e:
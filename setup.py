@@ -24,6 +24,7 @@ setup(
     author_email="coffeebreak@aettua.pt",
     keywords="development deployment automation cli",
     packages=find_packages(),
+    package_data={"coffeebreak.backup": ["data/*.in"]},
     python_requires=">=3.8",
     data_files=[
         ("man/man1", ["man/man1/coffeebreak.1"]),
@@ -51,7 +52,7 @@ setup(
     },
     entry_points={
         "console_scripts": [
-            "coffeebreak=coffeebreak.cli:cli",
+            "coffeebreak=coffeebreak.__main__:main",
         ],
     },
     project_urls={
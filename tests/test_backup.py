@@ -0,0 +1,782 @@
+"""Tests for backup system script generation."""
+
+import pytest
+import hashlib
+import os
+import shutil
+import stat
+import subprocess
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from coffeebreak.backup.cron import CronManager
+from coffeebreak.utils.errors import ConfigurationError
+from coffeebreak.backup.files import atomic_write, atomic_write_all, write_exec_script, write_if_changed
+from coffeebreak.backup.recovery import RecoveryManager, _add_months
+from coffeebreak.backup.scheduler import BackupScheduler, _cron_to_oncalendar
+from coffeebreak.backup.storage import BackupStorage
+from coffeebreak.backup.manager import (
+    BackupManager,
+    _BACKUP_SH_CLEANUP_FUNC,
+    _BACKUP_SH_FRAGMENTS,
+    _BACKUP_SH_HELPERS,
+    _VERIFY_SH_FRAGMENTS,
+    _render_script,
+)
+
+
+class TestWriteExecScript:
+    """Test atomic script installation."""
+
+    def test_writes_executable_script(self, temp_directory):
+        """Test that the script is written with executable permissions."""
+        script_path = os.path.join(temp_directory, 'test.sh')
+
+        write_exec_script(script_path, "#!/bin/bash\necho ok\n")
+
+        with open(script_path, 'r') as f:
+            assert f.read() == "#!/bin/bash\necho ok\n"
+        assert stat.S_IMODE(os.stat(script_path).st_mode) == 0o755
+
+    def test_replaces_existing_script(self, temp_directory):
+        """Test that an existing script is replaced without leftovers."""
+        script_path = os.path.join(temp_directory, 'test.sh')
+
+        write_exec_script(script_path, "old\n")
+        write_exec_script(script_path, "new\n")
+
+        with open(script_path, 'r') as f:
+            assert f.read() == "new\n"
+        assert os.listdir(temp_directory) == ['test.sh']
+
+    def test_atomic_write_sets_mode(self, temp_directory):
+        """Test that atomically written files get the requested mode."""
+        path = os.path.join(temp_directory, 'plan.md')
+
+        atomic_write(path, b'# Plan\n', 0o640)
+
+        with open(path, 'rb') as f:
+            assert f.read() == b'# Plan\n'
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+        assert os.listdir(temp_directory) == ['plan.md']
+
+    def test_atomic_write_joins_chunks(self, temp_directory):
+        """Test that chunked content is written in order without gaps."""
+        path = os.path.join(temp_directory, 'chunks.sh')
+
+        atomic_write(path, [b'#!/bin/bash\n', b'', b'echo ', b'ok\n'])
+
+        with open(path, 'rb') as f:
+            assert f.read() == b'#!/bin/bash\necho ok\n'
+
+    def test_atomic_write_all_keeps_files_on_failure(self, temp_directory):
+        """Test that no file is replaced when one of the writes fails."""
+        path = os.path.join(temp_directory, 'a.timer')
+        atomic_write(path, b'old\n')
+
+        with pytest.raises(OSError):
+            atomic_write_all({
+                path: b'new\n',
+                os.path.join(temp_directory, 'missing', 'b.timer'): b'new\n',
+            })
+
+        with open(path, 'rb') as f:
+            assert f.read() == b'old\n'
+        assert os.listdir(temp_directory) == ['a.timer']
+
+    def test_write_if_changed(self, temp_directory):
+        """Test that a file is only rewritten when its content or mode differs."""
+        path = os.path.join(temp_directory, 'backup-config.json')
+
+        assert write_if_changed(path, b'{}\n', 0o640) is True
+        os.utime(path, (0, 0))
+
+        assert write_if_changed(path, b'{}\n', 0o640) is False
+        assert os.stat(path).st_mtime == 0
+        assert write_if_changed(path, b'{}\n', 0o644) is True
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+    def test_skips_unchanged_script(self, temp_directory):
+        """Test that identical content (apart from the header) is not rewritten."""
+        script_path = os.path.join(temp_directory, 'test.sh')
+
+        assert write_exec_script(script_path, "# Generated: 1\necho ok\n") is True
+        os.utime(script_path, (0, 0))
+
+        assert write_exec_script(script_path, "# Generated: 2\necho ok\n") is False
+        assert os.stat(script_path).st_mtime == 0
+
+    def test_compares_chunks_with_existing_script(self, temp_directory):
+        """Test that chunked content is compared line by line across chunk boundaries."""
+        script_path = os.path.join(temp_directory, 'test.sh')
+
+        assert write_exec_script(script_path, "#!/bin/bash\n# Generated: 1\necho ok\n") is True
+        os.utime(script_path, (0, 0))
+
+        chunks = [b'#!/bin/bash\n# Gener', b'ated: ', b'2', b'\necho', b' ok\n']
+        assert write_exec_script(script_path, chunks) is False
+        assert os.stat(script_path).st_mtime == 0
+
+        assert write_exec_script(script_path, chunks + [b'echo more\n']) is True
+        assert write_exec_script(script_path, chunks[:-1]) is True
+        with open(script_path, 'rb') as f:
+            assert f.read() == b'#!/bin/bash\n# Generated: 2\necho'
+
+
+class TestCronManager:
+    """Test batched crontab editing."""
+
+    @patch('subprocess.run')
+    def test_add_is_idempotent(self, mock_run):
+        """Test that existing and repeated entries are not queued."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="0 1 * * * existing.sh\n")
+
+        cron = CronManager()
+        cron.load()
+
+        assert cron.add("0 1 * * * existing.sh") is False
+        assert cron.add("0 2 * * * new.sh") is True
+        assert cron.add("0 2 * * * new.sh") is False
+        assert cron.contains("new.sh")
+
+    @patch('subprocess.run')
+    def test_save_installs_crontab_once(self, mock_run):
+        """Test that pending entries are merged and written in one install."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="0 1 * * * existing.sh\n")
+
+        with CronManager() as cron:
+            cron.add("0 2 * * * a.sh", comment="A")
+            cron.add("0 3 * * * b.sh")
+
+        install_calls = [c for c in mock_run.call_args_list if c.args[0] == ['crontab', '-']]
+        assert len(install_calls) == 1
+        assert install_calls[0].kwargs['input'] == (
+            "0 1 * * * existing.sh\n# A\n0 2 * * * a.sh\n0 3 * * * b.sh\n"
+        )
+
+
+    @patch('subprocess.run')
+    def test_save_reports_crontab_error(self, mock_run):
+        """Test that a rejected crontab surfaces the command's error output."""
+        mock_run.side_effect = [
+            MagicMock(returncode=1, stdout='', stderr='no crontab for root'),
+            MagicMock(returncode=1, stdout='', stderr='no crontab for root'),
+            MagicMock(returncode=1, stdout='', stderr='"-":1: bad minute\n'),
+        ]
+
+        cron = CronManager()
+        cron.load()
+        cron.add("61 * * * * a.sh")
+
+        with pytest.raises(ConfigurationError, match='bad minute'):
+            cron.save()
+
+    @patch('subprocess.run')
+    def test_save_aborts_when_crontab_unreadable(self, mock_run):
+        """Test that a failed listing never replaces the crontab with only the pending entries."""
+        mock_run.side_effect = [
+            MagicMock(returncode=0, stdout='0 1 * * * existing.sh\n', stderr=''),
+            subprocess.TimeoutExpired(['crontab', '-l'], 10),
+            MagicMock(returncode=1, stdout='', stderr='crontab: permission denied\n'),
+        ]
+
+        cron = CronManager()
+        cron.load()
+        cron.add("0 2 * * * a.sh")
+
+        with pytest.raises(ConfigurationError, match='Failed to read crontab') as excinfo:
+            cron.save()
+        assert isinstance(excinfo.value.__cause__, subprocess.TimeoutExpired)
+
+        with pytest.raises(ConfigurationError, match='permission denied'):
+            cron.save()
+
+        assert all(c.args[0] != ['crontab', '-'] for c in mock_run.call_args_list)
+
+
+class TestBackupScheduler:
+    """Test backup scheduling setup."""
+
+    def test_create_scheduler_script(self, temp_directory):
+        """Test that the scheduler script is rendered from its template."""
+        scheduler = BackupScheduler(deployment_type='docker')
+
+        script_path = scheduler._create_scheduler_script(
+            'example.com', {'max_load_threshold': 1.5}, temp_directory)
+
+        with open(script_path, 'r') as f:
+            content = f.read()
+
+        assert f'BACKUP_SCRIPT="{temp_directory}/backup.sh"' in content
+        assert 'local max_load_x100=150' in content
+        assert '@' not in content
+        assert subprocess.run(['bash', '-n', script_path]).returncode == 0
+
+    @patch('subprocess.run')
+    def test_cron_jobs_added_once(self, mock_run, temp_directory):
+        """Test that the jobs share one dispatcher entry that replaces per-job lines."""
+        mock_run.return_value = MagicMock(
+            returncode=0, stdout=f"# CoffeeBreak backup verification\n"
+                                 f"0 4 * * * {temp_directory}/verify-backup.sh\n")
+        scheduler = BackupScheduler(deployment_type='docker')
+
+        with CronManager() as cron:
+            result = scheduler._setup_cron_jobs('example.com', {}, temp_directory, cron)
+            again = scheduler._setup_cron_jobs('example.com', {}, temp_directory, cron)
+
+        entry = f"0 2,3,4,*/6 * * * {temp_directory}/coffeebreak-cron-dispatch.sh"
+        assert result['jobs'] == [entry]
+        assert again['jobs'] == []
+
+        installed = [c.kwargs['input'] for c in mock_run.call_args_list
+                     if c.args[0] == ['crontab', '-']]
+        assert installed == [f"# CoffeeBreak backup jobs\n{entry}\n"]
+
+        dispatch_path = f"{temp_directory}/coffeebreak-cron-dispatch.sh"
+        with open(dispatch_path, 'r') as f:
+            content = f.read()
+
+        assert "    '0 3 * * 0|backup-scheduler.sh full'" in content
+        assert '@JOBS@' not in content
+
+    @patch('subprocess.run')
+    def test_named_schedules_keep_per_job_entries(self, mock_run, temp_directory):
+        """Test that schedules the dispatcher cannot evaluate stay separate cron entries."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="")
+        scheduler = BackupScheduler(deployment_type='docker')
+
+        with CronManager() as cron:
+            result = scheduler._setup_cron_jobs(
+                'example.com', {'full_backup_schedule': '@weekly'}, temp_directory, cron)
+
+        assert f"@weekly {temp_directory}/backup-scheduler.sh full" in result['jobs']
+        assert len(result['jobs']) == 4
+        assert not os.path.exists(f"{temp_directory}/coffeebreak-cron-dispatch.sh")
+
+
+    @patch('subprocess.run')
+    def test_context_installs_crontab_once(self, mock_run, temp_directory, monkeypatch):
+        """Test that setups inside the scheduler context share one crontab write."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="")
+        monkeypatch.chdir(temp_directory)
+        os.makedirs('scripts')
+
+        with BackupScheduler(deployment_type='docker') as scheduler:
+            first = scheduler.setup_backup_schedule('a.example.com', {})
+            second = scheduler.setup_backup_schedule('b.example.com', {})
+
+        assert first['success'] is True
+        assert second['success'] is True
+
+        commands = [c.args[0] for c in mock_run.call_args_list]
+        assert commands.count(['crontab', '-l']) == 2
+        assert commands.count(['crontab', '-']) == 1
+
+
+    def test_cron_to_oncalendar(self):
+        """Test that cron schedules become the matching systemd calendar events."""
+        assert _cron_to_oncalendar('0 2 * * *') == ['*-*-* 02:00:00']
+        assert _cron_to_oncalendar('0 3 * * 7') == ['Sun *-*-* 03:00:00']
+        assert _cron_to_oncalendar('30 */6 * * 1-5') == ['Mon,Tue,Wed,Thu,Fri *-*-* 00,06,12,18:30:00']
+        assert _cron_to_oncalendar('0 4 1 * mon') == ['*-*-01 04:00:00', 'Mon *-*-* 04:00:00']
+
+        with pytest.raises(ConfigurationError):
+            _cron_to_oncalendar('daily')
+
+    def test_invalid_schedule_rejected_before_setup(self):
+        """Test that a malformed schedule fails without touching the crontab."""
+        scheduler = BackupScheduler(deployment_type='docker')
+
+        with patch('subprocess.run') as mock_run:
+            result = scheduler.setup_backup_schedule('example.com', {'backup_schedule': '0 25 * * *'})
+
+        assert result['success'] is False
+        assert 'hour' in result['errors'][0]
+        mock_run.assert_not_called()
+
+
+class TestBackupStorage:
+    """Test backup storage setup."""
+
+    @patch('subprocess.run')
+    def test_storage_info_without_df(self, mock_run, temp_directory):
+        """Test that disk usage is read from statvfs rather than df."""
+        storage = BackupStorage()
+        info = storage._get_storage_info(temp_directory)
+
+        assert info['total_kb'] >= info['used_kb']
+        assert info['available_kb'] > 0
+        assert info['usage_percent'].endswith('%')
+        assert info['filesystem']
+        mock_run.assert_not_called()
+
+        # A reading from the last few seconds is reused
+        with patch('os.statvfs', side_effect=OSError):
+            assert storage._get_storage_info(temp_directory) == info
+
+    @patch('subprocess.run')
+    def test_setup_installs_crontab_once(self, mock_run, temp_directory, monkeypatch):
+        """Test that storage setup reads and installs the crontab once."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="")
+        monkeypatch.chdir(temp_directory)
+
+        result = BackupStorage().setup_backup_storage({'backup_dir': 'backups'})
+
+        assert result['success'] is True
+        installs = [c.kwargs['input'] for c in mock_run.call_args_list
+                    if c.args[0] == ['crontab', '-']]
+        assert installs == ["# CoffeeBreak storage monitoring\n"
+                            "0 */4 * * * ./scripts/storage-monitor.sh\n"]
+
+    @patch('subprocess.run')
+    def test_skip_unchanged_setup(self, mock_run, temp_directory, monkeypatch):
+        """Test that a repeated setup with the same config leaves the files alone."""
+        mock_run.return_value = MagicMock(
+            returncode=0, stdout="0 */4 * * * ./scripts/storage-monitor.sh\n")
+        monkeypatch.chdir(temp_directory)
+        storage = BackupStorage()
+
+        first = storage.setup_backup_storage({'backup_dir': 'backups'})
+        os.utime('backups/backup-config.json', (0, 0))
+        second = storage.setup_backup_storage({'backup_dir': 'backups'})
+
+        assert second['success'] is True
+        assert second['backup_path'] == first['backup_path']
+        assert os.stat('backups/backup-config.json').st_mtime == 0
+        assert os.path.exists('scripts/.coffeebreak-storage.stamp')
+        assert not os.path.exists('backups/.coffeebreak-storage.stamp')
+
+        third = storage.setup_backup_storage({'backup_dir': 'backups', 'retention_days': 7})
+
+        assert third['success'] is True
+        assert os.stat('backups/backup-config.json').st_mtime != 0
+
+
+class TestBackupScripts:
+    """Test backup script generation."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.manager = BackupManager(deployment_type='docker', verbose=False)
+
+    def test_create_backup_scripts(self):
+        """Test backup script creation in a Docker deployment."""
+        result = self.manager._create_backup_scripts('example.com', {})
+
+        assert result['success'] is True
+        assert result['scripts'] == ['./scripts/backup.sh']
+
+        with open('./scripts/backup.sh', 'r') as f:
+            content = f.read()
+
+        assert 'DOMAIN="example.com"' in content
+        assert 'BACKUP_DIR="./backups"' in content
+
+    def test_backup_script_fragments_render_valid_bash(self, temp_directory):
+        """Test that the assembled backup script is syntactically valid."""
+        script_path = os.path.join(temp_directory, 'backup.sh')
+        mapping = {
+            'DOMAIN': 'example.com', 'GENERATED': 'now', 'BACKUP_DIR': './backups',
+            'ENCRYPTION_KEY_FILE': './backup.key', 'RETENTION_DAYS': 30,
+            'ENABLE_ENCRYPTION': 'true', 'ENABLE_COMPRESSION': 'true',
+            'MAX_PARALLEL_DBS': 2, 'PG_DUMP_JOBS': 4, 'COMPRESS_PROGRAM': 'gzip',
+            'ARCHIVE_EXT': 'tar.gz', 'FILE_BACKUP_MODE': 'archive', 'DEDUP_REPO': '',
+            'MAIN_CALLS': '    backup_configs',
+        }
+
+        with open(script_path, 'w') as f:
+            f.write(_render_script(_BACKUP_SH_FRAGMENTS, mapping))
+
+        assert subprocess.run(['bash', '-n', script_path]).returncode == 0
+
+    def test_create_backup_scripts_emits_only_enabled_steps(self):
+        """Test that disabled backup steps are left out of main()."""
+        config = {'backup_databases': 'false', 'verify_backups': False}
+        result = self.manager._create_backup_scripts('example.com', config)
+
+        assert result['success'] is True
+
+        with open('./scripts/backup.sh', 'r') as f:
+            content = f.read()
+
+        main_body = content.split('main() {', 1)[1].split('\n}\n', 1)[0]
+        assert 'backup_files\n    backup_configs\n' in main_body
+        assert 'backup_postgresql' not in main_body
+        assert 'verify_backups' not in main_body
+
+    def test_create_backup_scripts_clamps_parallel_dbs(self):
+        """Test that pg_parallel_dbs below one still runs one dump at a time."""
+        result = self.manager._create_backup_scripts('example.com', {'pg_parallel_dbs': 0})
+
+        assert result['success'] is True
+
+        with open('./scripts/backup.sh', 'r') as f:
+            assert 'MAX_PARALLEL_DBS=1\n' in f.read()
+
+    def test_create_backup_scripts_creates_key_file(self):
+        """Test that the encryption key file is created with private permissions."""
+        result = self.manager._create_backup_scripts('example.com', {})
+
+        key_file = result['encryption_key_file']
+        assert os.path.exists(key_file)
+        assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o600
+
+    def test_create_backup_scripts_skips_key_file_when_disabled(self, temp_directory):
+        """Test that a string 'false' disables encryption without creating a key file."""
+        key_file = os.path.join(temp_directory, 'backup.key')
+        config = {'enable_encryption': 'false', 'encryption_key_file': key_file}
+        result = self.manager._create_backup_scripts('example.com', config)
+
+        assert result['success'] is True
+        assert result['encryption_key_file'] is None
+        assert not os.path.exists(key_file)
+
+    def test_cleanup_removes_empty_dirs_outside_snapshots(self, temp_directory):
+        """Test that cleanup removes empty directories but leaves snapshots and the storage config alone."""
+        backup_dir = os.path.join(temp_directory, 'backups')
+        os.makedirs(os.path.join(backup_dir, 'postgresql', '20250101_020000'))
+        os.makedirs(os.path.join(backup_dir, 'files', 'snapshots', '20250101_020000', 'empty'))
+        config_file = os.path.join(backup_dir, 'backup-config.json')
+        open(config_file, 'w').close()
+        os.utime(config_file, (0, 0))
+
+        script_path = os.path.join(temp_directory, 'cleanup.sh')
+        with open(script_path, 'w') as f:
+            f.write(f'BACKUP_DIR="{backup_dir}"\nLOG_FILE=/dev/null\nRETENTION_DAYS=30\n'
+                    'MAX_PARALLEL_JOBS=2\nDEDUP_REPO=""\n')
+            f.write(_render_script((_BACKUP_SH_HELPERS, _BACKUP_SH_CLEANUP_FUNC), {}))
+            f.write('cleanup_old_backups\n')
+
+        assert subprocess.run(['bash', script_path], capture_output=True).returncode == 0
+        assert not os.path.exists(os.path.join(backup_dir, 'postgresql', '20250101_020000'))
+        assert os.path.isdir(os.path.join(backup_dir, 'files', 'snapshots', '20250101_020000', 'empty'))
+        assert os.path.exists(config_file)
+
+    def test_cleanup_keeps_old_repository_files(self, temp_directory):
+        """Test that cleanup leaves the restic repository to restic, even with a relative BACKUP_DIR."""
+        backup_dir = os.path.join(temp_directory, 'backups')
+        pack_dir = os.path.join(backup_dir, 'repo', 'data', '00')
+        os.makedirs(pack_dir)
+        pack = os.path.join(pack_dir, '00abc')
+        expired = os.path.join(backup_dir, 'configs', '20250101_020000.tar.gz')
+        os.makedirs(os.path.dirname(expired))
+        for path in (pack, expired):
+            open(path, 'w').close()
+            os.utime(path, (0, 0))
+
+        script_path = os.path.join(temp_directory, 'cleanup.sh')
+        with open(script_path, 'w') as f:
+            f.write('BACKUP_DIR="backups"\nLOG_FILE=/dev/null\nRETENTION_DAYS=30\n'
+                    f'MAX_PARALLEL_JOBS=2\nDEDUP_REPO="{os.path.join(backup_dir, "repo")}"\n')
+            f.write(_render_script((_BACKUP_SH_HELPERS, _BACKUP_SH_CLEANUP_FUNC), {}))
+            f.write('cleanup_old_backups\n')
+
+        result = subprocess.run(['bash', script_path], capture_output=True, cwd=temp_directory)
+        assert result.returncode == 0
+        assert os.path.exists(pack)
+        assert not os.path.exists(expired)
+
+    def test_verify_script_checks_manifest_entries(self, temp_directory):
+        """Test that verify-backup.sh checks the manifest entries and nothing else."""
+        backup_dir = os.path.join(temp_directory, 'backups')
+        os.makedirs(os.path.join(backup_dir, 'postgresql'))
+        os.makedirs(os.path.join(backup_dir, 'manifests'))
+        archive = os.path.join(backup_dir, 'postgresql', '20250101_020000.tar.gz')
+        with open(archive, 'wb') as f:
+            f.write(b'backup')
+        with open(os.path.join(backup_dir, 'postgresql', 'manifest-20250101.tsv'), 'w') as f:
+            f.write('left over from an older layout\n')
+        with open(os.path.join(backup_dir, 'manifests', 'postgresql-20250101.tsv'), 'w') as f:
+            f.write(f"{archive}\t6\t{hashlib.sha256(b'backup').hexdigest()}\n")
+
+        script_path = os.path.join(temp_directory, 'verify-backup.sh')
+        mapping = {'BACKUP_DIR': backup_dir, 'DEDUP_REPO': '', 'ENCRYPTION_KEY_FILE': ''}
+        with open(script_path, 'w') as f:
+            f.write(_render_script(_VERIFY_SH_FRAGMENTS, mapping))
+
+        result = subprocess.run(['bash', script_path, '20250101'], capture_output=True, text=True)
+        assert result.returncode == 0
+        assert '1 verified, 0 failed' in result.stdout
+
+        with open(archive, 'ab') as f:
+            f.write(b'!')
+
+        result = subprocess.run(['bash', script_path, '20250101'], capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'Backup corrupted' in result.stdout
+
+    def test_create_backup_scripts_rejects_unknown_compressor(self):
+        """Test that an unsupported compressor is reported as an error."""
+        result = self.manager._create_backup_scripts('example.com', {'compressor': 'lzma'})
+
+        assert result['success'] is False
+        assert 'Unsupported compressor' in result['errors'][0]
+
+    def test_create_backup_scripts_rejects_encrypted_snapshots(self):
+        """Test that snapshot mode requires encryption to be disabled."""
+        result = self.manager._create_backup_scripts('example.com', {'file_backup_mode': 'link-dest'})
+
+        assert result['success'] is False
+        assert 'unencrypted snapshots' in result['errors'][0]
+
+        result = self.manager._create_backup_scripts(
+            'example.com', {'file_backup_mode': 'link-dest', 'enable_encryption': False})
+
+        assert result['success'] is True
+
+    @patch('subprocess.Popen')
+    @patch('subprocess.run')
+    def test_setup_backup_system_component_order(self, mock_run, mock_popen):
+        """Test that components are reported in setup order."""
+        mock_run.return_value = MagicMock(returncode=0, stdout='')
+        mock_popen.return_value = MagicMock(returncode=0)
+        recovery_result = {'success': True, 'errors': [], 'recovery_scripts': []}
+
+        with patch.object(self.manager.recovery, 'setup_recovery_procedures',
+                          return_value=recovery_result):
+            result = self.manager.setup_backup_system('example.com')
+
+        assert result['success'] is True, result['errors']
+        assert result['components_setup'] == [
+            'backup_storage',
+            'backup_scripts',
+            'backup_scheduling',
+            'recovery_procedures',
+            'backup_verification',
+            'backup_monitoring',
+        ]
+        assert result['recovery_scripts'] == ['./scripts/backup.sh']
+
+    @patch('subprocess.run')
+    def test_setup_backup_system_steps_create_scripts_dir(self, mock_run, temp_directory, monkeypatch):
+        """Test that steps writing scripts do not rely on another step creating the directory."""
+        mock_run.return_value = MagicMock(returncode=0, stdout='')
+        monkeypatch.chdir(temp_directory)
+        # Stand in for the steps that create the scripts directory running last
+        done = {'success': True, 'errors': []}
+
+        with patch.object(self.manager.storage, 'setup_backup_storage', return_value=done), \
+             patch.object(self.manager, '_create_backup_scripts', return_value=done), \
+             patch.object(self.manager.recovery, 'setup_recovery_procedures', return_value=done):
+            result = self.manager.setup_backup_system('example.com')
+
+        assert result['success'] is True, result['errors']
+        assert os.path.exists('scripts/backup-scheduler.sh')
+        assert os.path.exists('scripts/verify-backup.sh')
+        assert os.path.exists('scripts/monitor-backup.sh')
+
+    @patch('subprocess.run')
+    def test_setup_backup_system_runs_storage_first(self, mock_run, temp_directory, monkeypatch):
+        """Test that no step starts before storage has prepared the backup directory."""
+        mock_run.return_value = MagicMock(returncode=0, stdout='')
+        monkeypatch.chdir(temp_directory)
+        storage_done = threading.Event()
+        started_early = []
+
+        def setup_storage(config, cron):
+            time.sleep(0.1)
+            storage_done.set()
+            return {'success': True, 'errors': []}
+
+        def step(*args):
+            if not storage_done.is_set():
+                started_early.append(args)
+            return {'success': True, 'errors': []}
+
+        with patch.object(self.manager.storage, 'setup_backup_storage', side_effect=setup_storage), \
+             patch.object(self.manager, '_create_backup_scripts', side_effect=step), \
+             patch.object(self.manager.scheduler, 'setup_backup_schedule', side_effect=step), \
+             patch.object(self.manager.recovery, 'setup_recovery_procedures', side_effect=step), \
+             patch.object(self.manager, '_setup_backup_verification', side_effect=step), \
+             patch.object(self.manager, '_setup_backup_monitoring', side_effect=step):
+            result = self.manager.setup_backup_system('example.com')
+
+        assert result['success'] is True, result['errors']
+        assert started_early == []
+
+
+class TestRecoveryScripts:
+    """Test recovery script generation."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.recovery = RecoveryManager(deployment_type='docker', verbose=False)
+
+    def test_create_recovery_scripts(self, temp_directory):
+        """Test that the recovery script is rendered from its template."""
+        scripts = self.recovery._create_recovery_scripts(
+            'example.com', {'backup_dir': '/srv/backups'}, temp_directory)
+
+        script_path = os.path.join(temp_directory, 'recovery.sh')
+        assert script_path in scripts
+        with open(script_path, 'r') as f:
+            content = f.read()
+
+        assert 'DOMAIN="example.com"' in content
+        assert 'BACKUP_DIR="/srv/backups"' in content
+        assert '@DOMAIN@' not in content
+        assert '@GENERATED@' not in content
+        assert subprocess.run(['bash', '-n', script_path]).returncode == 0
+
+        emergency_path = os.path.join(temp_directory, 'emergency-recovery.sh')
+        assert emergency_path in scripts
+        with open(emergency_path, 'r') as f:
+            content = f.read()
+
+        assert f'RECOVERY_SCRIPT="{temp_directory}/recovery.sh"' in content
+        assert '@' not in content
+        assert subprocess.run(['bash', '-n', emergency_path]).returncode == 0
+
+    def test_recovery_selects_newest_file_snapshot(self, temp_directory):
+        """Test that completed snapshots are restorable file backups."""
+        backup_dir = os.path.join(temp_directory, 'backups')
+        files_dir = os.path.join(backup_dir, 'files')
+        snapshots_dir = os.path.join(files_dir, 'snapshots')
+        for name in ('20261017_020000', '20261018_020000'):
+            os.makedirs(os.path.join(snapshots_dir, name))
+        archive = os.path.join(files_dir, '20261016_020000.tar.gz')
+        open(archive, 'w').close()
+        os.utime(archive, (1000, 1000))
+        completed = os.path.join(snapshots_dir, '20261017_020000')
+        open(os.path.join(completed, '.completed'), 'w').close()
+        os.utime(completed, (2000, 2000))
+
+        self.recovery._create_recovery_scripts('example.com', {'backup_dir': backup_dir}, temp_directory)
+        with open(os.path.join(temp_directory, 'recovery.sh'), 'r') as f:
+            script = f.read().replace('main "$@"', '')
+
+        # The unfinished snapshot is newer but must not be picked
+        result = subprocess.run(['bash', '-c', script + 'select_file_backup latest'],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        assert result.stdout.strip() == completed
+
+        result = subprocess.run(['bash', '-c', script + 'select_file_backup 20261016'],
+                                capture_output=True, text=True)
+        assert result.stdout.strip() == archive
+
+    def test_recovery_reads_repository_backups(self, temp_directory, monkeypatch):
+        """Test that backups stored with restic are selected and streamed from the repository."""
+        bin_dir = os.path.join(temp_directory, 'bin')
+        os.makedirs(bin_dir)
+        restic = os.path.join(bin_dir, 'restic')
+        with open(restic, 'w') as f:
+            f.write('#!/bin/bash\n'
+                    'case "$1" in\n'
+                    '    snapshots) echo \'[{"tags":["postgresql-20261017_020000"]},'
+                    '{"tags":["postgresql-20261018_020000"]},{"tags":["files-20261018_020000"]}]\' ;;\n'
+                    '    ls) echo "snapshot abc of [/$3.tar]"; echo "/$3.tar" ;;\n'
+                    '    dump) echo "$RESTIC_REPOSITORY $*" ;;\n'
+                    'esac\n')
+        os.chmod(restic, 0o755)
+        monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+
+        repo = os.path.join(temp_directory, 'repo')
+        config = {'backup_dir': os.path.join(temp_directory, 'backups'), 'dedup_repo': repo}
+        self.recovery._create_recovery_scripts('example.com', config, temp_directory)
+        with open(os.path.join(temp_directory, 'recovery.sh'), 'r') as f:
+            script = f.read().replace('main "$@"', '')
+
+        result = subprocess.run(['bash', '-c', script + 'select_backup postgresql latest'],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        assert result.stdout.strip() == 'restic:postgresql-20261018_020000/postgresql-20261018_020000.tar'
+
+        result = subprocess.run(['bash', '-c', script + 'select_backup postgresql 20261017'],
+                                capture_output=True, text=True)
+        assert result.stdout.strip() == 'restic:postgresql-20261017_020000/postgresql-20261017_020000.tar'
+
+        result = subprocess.run(['bash', '-c', script + 'backup_stream "$(select_file_backup latest)"'],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        assert result.stdout.strip() == (f'{repo} dump --quiet --tag files-20261018_020000 '
+                                         'latest /files-20261018_020000.tar')
+
+        result = subprocess.run(['bash', '-c', script + 'select_backup configs latest'],
+                                capture_output=True, text=True)
+        assert result.returncode == 1
+        assert 'No backup found for type: configs' in result.stderr
+
+    @pytest.mark.skipif(shutil.which('gpg') is None, reason="gpg not installed")
+    def test_gpg_backup_round_trip(self, temp_directory, monkeypatch):
+        """Test that the gpg fallback encrypts and decrypts with the key file alone."""
+        gnupg_home = os.path.join(temp_directory, 'gnupg')
+        os.makedirs(gnupg_home, mode=0o700)
+        monkeypatch.setenv('GNUPGHOME', gnupg_home)
+        key_file = os.path.join(temp_directory, 'backup.key')
+        with open(key_file, 'w') as f:
+            f.write('secret\n')
+        archive = os.path.join(temp_directory, 'backup.tar.gpg')
+
+        encrypt = (f'LOG_FILE=/dev/null\nENCRYPTION_TOOL=gpg\nENCRYPTION_KEY_FILE="{key_file}"\n'
+                   + _render_script((_BACKUP_SH_HELPERS,), {})
+                   + f'echo payload | encrypt_stream "{archive}"\n')
+        assert subprocess.run(['bash', '-c', encrypt], capture_output=True).returncode == 0
+
+        self.recovery._create_recovery_scripts('example.com', {'encryption_key_file': key_file}, temp_directory)
+        with open(os.path.join(temp_directory, 'recovery.sh'), 'r') as f:
+            script = f.read().replace('main "$@"', '')
+
+        result = subprocess.run(['bash', '-c', script + f'backup_stream "{archive}"'],
+                                capture_output=True, text=True)
+        assert result.returncode == 0
+        assert result.stdout == 'payload\n'
+
+    def test_recovery_clamps_parallel_dbs(self, temp_directory):
+        """Test that pg_parallel_dbs of zero cannot divide the restore jobs by zero."""
+        self.recovery._create_recovery_scripts('example.com', {'pg_parallel_dbs': 0}, temp_directory)
+
+        with open(os.path.join(temp_directory, 'recovery.sh'), 'r') as f:
+            assert 'MAX_PARALLEL_DBS=1\n' in f.read()
+
+    def test_disaster_recovery_plan_late_in_year(self, temp_directory):
+        """Test that the plan's review date rolls over into the next year."""
+        assert _add_months(datetime(2026, 10, 1), 3) == datetime(2027, 1, 1)
+        assert _add_months(datetime(2026, 11, 30), 3) == datetime(2027, 2, 28)
+        assert _add_months(datetime(2027, 12, 31), 3) == datetime(2028, 3, 31)
+        assert _add_months(datetime(2027, 11, 30), 3) == datetime(2028, 2, 29)
+
+        plan_file = self.recovery._create_disaster_recovery_plan('example.com', {}, temp_directory)
+
+        with open(plan_file, 'r') as f:
+            assert '**Next Review Date**: ' in f.read()
+
+    def test_generated_timestamp_is_shared(self, temp_directory):
+        """Test that scripts and documents use the timestamp they are given."""
+        now = datetime(2026, 10, 31, 12, 0, 0)
+
+        self.recovery._create_recovery_scripts('example.com', {}, temp_directory, now)
+        plan_file = self.recovery._create_disaster_recovery_plan('example.com', {}, temp_directory, now)
+
+        with open(os.path.join(temp_directory, 'recovery.sh'), 'r') as f:
+            assert '# Generated: 2026-10-31T12:00:00' in f.read()
+        with open(plan_file, 'r') as f:
+            plan = f.read()
+        assert '2026-10-31T12:00:00' in plan
+        assert '**Next Review Date**: 2027-01-31' in plan
+
+    def test_setup_reports_step_errors(self, temp_directory):
+        """Test that a failing step is reported without hiding the others."""
+        with patch.object(self.recovery, '_create_disaster_recovery_plan',
+                          side_effect=ConfigurationError("Disaster recovery plan creation failed: boom")):
+            result = self.recovery.setup_recovery_procedures('example.com', {})
+
+        assert result['success'] is False
+        assert result['errors'] == ["Disaster recovery plan creation failed: boom"]
+        assert result['recovery_scripts'] == ['./scripts/recovery.sh', './scripts/emergency-recovery.sh']
+
+    def test_setup_skips_unchanged_inputs(self):
+        """Test that a repeated setup with the same inputs rewrites nothing."""
+        first = self.recovery.setup_recovery_procedures('example.com', {})
+        assert first['success'] is True, first['errors']
+
+        with patch('coffeebreak.backup.recovery.atomic_write') as mock_write:
+            second = self.recovery.setup_recovery_procedures('example.com', {})
+            assert not mock_write.called
+
+            self.recovery.setup_recovery_procedures('example.com', {'rto_hours': 8})
+            assert mock_write.called
+
+        assert second == first
@@ -25,6 +25,16 @@ class TestCLICommands:
         assert result.exit_code == 0
         assert 'version' in result.output.lower()
     
+    def test_main_version_fast_path(self, capsys):
+        """Test that the entry point answers --version in Click's format."""
+        from coffeebreak import __version__
+        from coffeebreak.__main__ import main
+        
+        with patch.object(sys, 'argv', ['coffeebreak', '--version']):
+            main()
+        
+        assert capsys.readouterr().out == f"coffeebreak, version {__version__}\n"
+    
     def test_cli_help(self):
         """Test CLI help display."""
         result = self.runner.invoke(cli, ['--help'])
@@ -100,6 +110,15 @@ class TestCLICommands:
         assert result.exit_code == 0
         assert 'Initializing CoffeeBreak production environment' in result.output
     
+    def test_init_production_requires_domain_without_terminal(self):
+        """Test init production fails fast instead of prompting without a terminal."""
+        with patch('coffeebreak.environments.production.ProductionEnvironment') as mock_prod_env:
+            result = self.runner.invoke(cli, ['init', 'production'])
+            
+            assert result.exit_code == 2
+            assert '--domain is required' in result.output
+            mock_prod_env.assert_not_called()
+    
     def test_build_command_without_plugin(self):
         """Test build command without plugin specification."""
         result = self.runner.invoke(cli, ['build'])
@@ -168,6 +187,32 @@ class TestCLICommands:
                 assert result.exit_code == 0
                 assert 'No dependency containers running' in result.output
     
+    def test_status_uninitialized(self):
+        """Test status reports a missing configuration."""
+        with patch('coffeebreak.environments.detector.os.path.exists', return_value=False):
+            result = self.runner.invoke(cli, ['status'])
+        
+        assert result.exit_code == 0
+        assert 'Environment Type: uninitialized' in result.output
+        assert 'No configuration found' in result.output
+    
+    def test_logs_tail(self):
+        """Test logs command shows the last lines of the log file."""
+        import json
+        import os
+        
+        with self.runner.isolated_filesystem():
+            os.makedirs('.coffeebreak')
+            with open('web.log', 'w') as f:
+                f.write(''.join(f"line {i}  \n" for i in range(10)))
+            with open('.coffeebreak/pids.json', 'w') as f:
+                json.dump({'web': {'log_file': 'web.log'}}, f)
+            
+            result = self.runner.invoke(cli, ['logs', '--tail', '3'])
+        
+        assert result.exit_code == 0
+        assert result.output == "line 7\nline 8\nline 9\n"
+
     def test_deps_logs_command(self):
         """Test deps logs command."""
         result = self.runner.invoke(cli, ['deps', 'logs'])